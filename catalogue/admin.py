@@ -7,3 +7,8 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'restaurant_id', 'price', 'created_at')
     search_fields = ('name',)
     ordering = ('-created_at',)
+    list_filter = ('deleted_at',)
+
+    def get_queryset(self, request):
+        # admins also manage soft-deleted rows
+        return Product.all_objects.all()
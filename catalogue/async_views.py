@@ -0,0 +1,124 @@
+"""Product reads for the ASGI deployment, routed when ``CATALOGUE_ASYNC_READS`` is on.
+
+``ProductViewSet`` serializes the rows and only then asks the Stock API, so
+the two latencies add up and the worker thread waits for both. Here the sync
+part of a read (authentication, ETag, query, serialization) still runs on the
+request's thread, but the availability lookup is started on the event loop as
+soon as the rows are fetched: the Stock API call overlaps serialization and
+waits on the loop, through ``async_stock_client``'s pool, instead of on a
+thread. Responses are the same as ``ProductViewSet``'s.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.response import Response
+
+from .stock_cache import availability_cache
+from .stock_client import async_stock_client
+from .views import ProductViewSet, product_ids, set_stock_flags
+
+
+async def _fetch_one_availability(ids):
+    available = await async_stock_client.availability(ids[0])
+    return {} if available is None else {ids[0]: available}
+
+
+def start_on_loop(loop, coroutine):
+    """Run ``coroutine`` on ``loop`` from a sync thread and return a ``concurrent.futures.Future``.
+
+    The task runs in a copy of the calling thread's context, so the request's
+    ``core.timing`` measurements see it.
+    """
+    future = Future()
+
+    def chain(task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        # the loop only keeps weak references to its tasks
+        future.task = loop.create_task(coroutine)
+        future.task.add_done_callback(chain)
+
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return future
+
+
+class AsyncProductReads(ProductViewSet):
+    """``list``/``retrieve`` that leave ``in_stock`` to the caller.
+
+    The response carries the running lookup in ``availability`` (a future of
+    ``{str(id): bool}``, or ``{}`` for an empty page); 304s, errors and reads without ``in_stock`` in their
+    ``?fields=`` carry none.
+    """
+
+    def start_availability(self, ids, fetch):
+        return start_on_loop(self.request.event_loop, availability_cache.alookup(ids, fetch))
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.list_rows, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.retrieve_row, *args, **kwargs)
+
+    def list_rows(self, request, *args, **kwargs):
+        queryset = self.read_queryset()
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        availability = None
+        if self.wants('in_stock'):
+            ids = [row['id'] if isinstance(row, dict) else row.id for row in rows]
+            availability = self.start_availability(ids, async_stock_client.availability_many) if ids else {}
+        data = self.represent(rows, many=True)
+        response = self.get_paginated_response(data) if page is not None else Response(data)
+        response.availability = availability
+        return response
+
+    def retrieve_row(self, request, *args, **kwargs):
+        row = self.read_object()
+        availability = None
+        if self.wants('in_stock'):
+            product_id = row['id'] if isinstance(row, dict) else row.id
+            availability = self.start_availability([product_id], _fetch_one_availability)
+        response = Response(self.represent(row))
+        response.availability = availability
+        return response
+
+
+def product_view(actions):
+    """An async view for the ``ProductViewSet`` ``actions`` of one route.
+
+    ``GET``/``HEAD`` go through ``AsyncProductReads``; writes run
+    ``ProductViewSet`` unchanged on the request's thread.
+    """
+    reads = sync_to_async(AsyncProductReads.as_view({'get': actions['get']}))
+    writes = sync_to_async(ProductViewSet.as_view(actions))
+    detail = actions['get'] == 'retrieve'
+
+    async def view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await writes(request, *args, **kwargs)
+        request.event_loop = asyncio.get_running_loop()
+        response = await reads(request, *args, **kwargs)
+        availability = getattr(response, 'availability', None)
+        if response.status_code != status.HTTP_200_OK or availability is None:
+            return response
+        in_stock_map = availability if isinstance(availability, dict) else await asyncio.wrap_future(availability)
+        if detail:
+            product_id = response.data.get('id')
+            response.data['in_stock'] = None if product_id is None else in_stock_map.get(str(product_id))
+        else:
+            items, _ = product_ids(response.data)
+            if items is not None:
+                set_stock_flags(items, in_stock_map)
+        return response
+
+    return csrf_exempt(view)
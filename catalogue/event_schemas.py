@@ -0,0 +1,77 @@
+import datetime
+import decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from .models import Category, CategoryMenu, Menu, Product, ProductCategory, ProductCategoryMenu
+
+_encoder = DjangoJSONEncoder()
+
+
+def _render(value):
+    # unsaved instances may still hold the raw input (e.g. a price string)
+    if isinstance(value, (datetime.datetime, decimal.Decimal)):
+        return _encoder.default(value)
+    return value
+
+
+class EventSchema:
+    """The fields a model publishes in its catalogue events.
+
+    Field lookups and value converters are resolved once, so dumping an
+    instance is a tuple walk. Values are JSON-native (Decimals and datetimes
+    are rendered the way ``DjangoJSONEncoder`` does). Many-to-many fields are
+    only included when their value is known without a query: passed in by the
+    writer that changed them, or already prefetched. Consumers treat a missing
+    key as unchanged.
+    """
+
+    def __init__(self, model, fields, many_to_many=()):
+        self.model = model
+        self.resource = model.__name__.lower()
+        self.fields = tuple(self._compile(model._meta.get_field(name)) for name in fields)
+        self.many_to_many = tuple(many_to_many)
+
+    @staticmethod
+    def _compile(field):
+        if isinstance(field, (models.DateTimeField, models.DecimalField)):
+            convert = _render
+        else:
+            convert = None
+        return field.name, field.attname, convert
+
+    def dump(self, instance, **many_to_many):
+        payload = {}
+        for name, attname, convert in self.fields:
+            value = getattr(instance, attname)
+            payload[name] = convert(value) if convert is not None and value is not None else value
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        for name in self.many_to_many:
+            if name in many_to_many:
+                payload[name] = list(many_to_many[name])
+            elif name in prefetched:
+                payload[name] = [obj.pk for obj in prefetched[name]]
+        return payload
+
+
+SCHEMAS = {
+    schema.model: schema
+    for schema in (
+        EventSchema(Menu, ('id', 'name', 'description', 'image_url', 'price', 'restaurant_id', 'deleted_at', 'updated_at')),
+        EventSchema(Category, ('id', 'restaurant_id', 'name', 'description', 'image_url', 'deleted_at', 'updated_at')),
+        EventSchema(
+            Product,
+            ('id', 'name', 'restaurant_id', 'description', 'image_url', 'price', 'category', 'available', 'deleted_at', 'updated_at'),
+            many_to_many=('categories',),
+        ),
+        EventSchema(ProductCategory, ('id', 'category', 'product')),
+        EventSchema(CategoryMenu, ('id', 'menu', 'name', 'quantity')),
+        EventSchema(ProductCategoryMenu, ('id', 'category', 'product')),
+    )
+}
+
+
+def event_payload(instance, **many_to_many):
+    """The event payload of ``instance`` according to its model's schema."""
+    return SCHEMAS[type(instance)].dump(instance, **many_to_many)
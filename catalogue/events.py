@@ -1,13 +1,32 @@
 from django.utils import timezone
-from core.rabbitmq import publish_event
 
+from core import timing
 
-def publish_catalogue_event(resource: str, action: str, resource_id, payload: dict):
+from .models import OutboxEvent
+
+# bump when the envelope or a schema in event_schemas changes incompatibly
+EVENT_ENVELOPE_VERSION = 1
+
+
+def _outbox_event(resource: str, action: str, resource_id, payload: dict, timestamp: str):
     event = {
+        'version': EVENT_ENVELOPE_VERSION,
         'resource': resource,
         'action': action,
         'id': resource_id,
-        'timestamp': timezone.now().isoformat(),
+        'timestamp': timestamp,
         'payload': payload,
     }
-    publish_event(f"catalogue.{resource}.{action}", event)
+    return OutboxEvent(routing_key=f"catalogue.{resource}.{action}", payload=event)
+
+
+def publish_catalogue_events(events):
+    """Record ``(resource, action, id, payload)`` events in the outbox with a single INSERT.
+
+    ``relay_outbox_events`` ships them to the broker once the transaction commits.
+    """
+    if not events:
+        return
+    with timing.timed('publish'):
+        timestamp = timezone.now().isoformat()
+        OutboxEvent.objects.bulk_create(_outbox_event(*event, timestamp) for event in events)
@@ -0,0 +1,41 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import CharField, F, Func, Q, Value
+from rest_framework import filters
+
+SEARCH_CONFIG = 'french_unaccent'
+# relevance first; ``id`` breaks ties so the order is total
+SEARCH_ORDERING = ('-search_rank', 'id')
+
+
+class Unaccent(Func):
+    """Immutable ``unaccent`` wrapper created by migration 0005, usable by the trigram indexes."""
+    function = 'catalogue_unaccent'
+    output_field = CharField()
+
+
+class CatalogueSearchFilter(filters.SearchFilter):
+    """Ranked full-text + trigram search on PostgreSQL.
+
+    Matches the maintained ``search_vector`` (French stemming, accent-insensitive)
+    or a fuzzy trigram match on the unaccented name, both served by GIN indexes,
+    and orders by relevance. Other databases fall back to DRF's ``icontains`` search.
+    ``CatalogueCursorPagination`` pages ranked results by ``search_rank``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if connections[queryset.db].vendor != 'postgresql' or not hasattr(queryset.model, 'search_vector'):
+            return super().filter_queryset(request, queryset, view)
+
+        text = ' '.join(terms)
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        term = Unaccent(Value(text))
+        return (
+            queryset.annotate(name_unaccent=Unaccent(F('name')))
+            .filter(Q(search_vector=query) | Q(name_unaccent__trigram_similar=term))
+            .annotate(search_rank=SearchRank(F('search_vector'), query) + TrigramSimilarity('name_unaccent', term))
+            .order_by(*SEARCH_ORDERING)
+        )
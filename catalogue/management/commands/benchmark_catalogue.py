@@ -0,0 +1,358 @@
+import json
+import math
+import random
+import socket
+import statistics
+import threading
+import time
+from contextvars import ContextVar
+from socketserver import ThreadingMixIn
+from unittest import mock
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import requests
+import uvicorn
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from catalogue.models import Menu, Product
+from catalogue.stock_client import stock_client
+from catalogue.stock_stub import StockStub
+
+ROUTES = {
+    "list": "/catalogue/restaurants/{restaurant_id}/products/",
+    "retrieve": "/catalogue/restaurants/{restaurant_id}/products/{product_id}/",
+    "menu": "/catalogue/menus/{menu_id}/products/",
+    "search": "/catalogue/restaurants/{restaurant_id}/products/?search={term}",
+}
+QUERY_COUNT_HEADER = "X-Query-Count"
+
+# the query count of the request being served, on whichever thread runs its queries
+_query_count = ContextVar("benchmark_query_count", default=None)
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _count_query(execute, sql, params, many, context):
+    count = _query_count.get()
+    if count is not None:
+        count[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+class QueryCountingApp:
+    """WSGI wrapper reporting the SQL queries of each request in ``X-Query-Count``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        count = [0]
+        token = _query_count.set(count)
+
+        def counted_start_response(status, headers, exc_info=None):
+            return start_response(status, headers + [(QUERY_COUNT_HEADER, str(count[0]))], exc_info)
+
+        try:
+            return self.app(environ, counted_start_response)
+        finally:
+            _query_count.reset(token)
+
+
+class QueryCountingASGIApp:
+    """ASGI counterpart of :class:`QueryCountingApp`.
+
+    Django runs the sync parts of an ASGI request on executor threads with a
+    copy of the request context, so the count set here follows the queries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        count = [0]
+        _query_count.set(count)
+
+        async def counted_send(message):
+            if message["type"] == "http.response.start":
+                headers = [*message.get("headers", []), (QUERY_COUNT_HEADER.lower().encode(), str(count[0]).encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, counted_send)
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the catalogue read routes in-process against a local Stock API stub, "
+        "served through WSGI (wsgiref) or ASGI (uvicorn)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Measured requests")
+        parser.add_argument("--warmup", type=int, default=50, help="Requests sent before measuring")
+        parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+        parser.add_argument("--mix", default="list=4,retrieve=4,menu=1,search=1", help="Route weights, e.g. list=4,search=1")
+        parser.add_argument("--restaurants", type=int, default=20, help="Restaurants sampled from the database")
+        parser.add_argument(
+            "--page-size", type=int, default=None,
+            help="Send ?page_size= on list and search (default: the server's CATALOGUE_PAGE_SIZE)",
+        )
+        parser.add_argument(
+            "--server", choices=("wsgi", "asgi"), default="wsgi",
+            help="Stack serving the requests; the deployment runs asgi, whose async product reads are only "
+                 "routed when CATALOGUE_ASYNC_READS=1 is set in the environment",
+        )
+        parser.add_argument("--stock-latency-ms", type=float, default=20.0, help="Stock stub latency")
+        parser.add_argument("--stock-jitter-ms", type=float, default=5.0, help="Stock stub latency jitter (+/-)")
+        parser.add_argument("--stock-failure-rate", type=float, default=0.0, help="Share of Stock stub calls answering 503")
+        parser.add_argument("--no-cache", action="store_true", help="Disable the response and availability caches")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the request schedule and the stub")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        targets = self.targets(rng, options["restaurants"])
+        if not targets:
+            self.stderr.write("No restaurants with products found; seed the database first (see generate_catalogue).")
+            return
+        mix = self.parse_mix(options["mix"])
+        unknown = sorted(set(mix) - set(ROUTES))
+        if unknown:
+            self.stderr.write(f"Unknown routes in --mix: {', '.join(unknown)} (expected {', '.join(ROUTES)})")
+            return
+        schedule = self.schedule(rng, targets, mix, options["warmup"] + options["requests"], options["page_size"])
+        async_reads = getattr(settings, "CATALOGUE_ASYNC_READS", False)
+        if options["server"] == "asgi" and not async_reads:
+            # catalogue.urls picks the product views at import, before this command runs
+            self.stderr.write(
+                "CATALOGUE_ASYNC_READS is off: product routes run the sync views under ASGI. "
+                "Set CATALOGUE_ASYNC_READS=1 to measure the deployed async reads."
+            )
+
+        stub = StockStub(
+            latency_ms=options["stock_latency_ms"],
+            jitter_ms=options["stock_jitter_ms"],
+            failure_rate=options["stock_failure_rate"],
+            seed=options["seed"],
+        ).start()
+        overrides = {"STOCK_API_BASE": stub.base_url, "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "127.0.0.1"]}
+        if options["no_cache"]:
+            overrides.update(CATALOGUE_RESPONSE_CACHE_TTL=0, STOCK_AVAILABILITY_CACHE_TTL=0)
+        for conn in connections.all(initialized_only=True):
+            _install_query_counter(conn)
+        connection_created.connect(_install_query_counter)
+        # the broker is stubbed in-process: nothing on the read path may reach RabbitMQ
+        with override_settings(**overrides), mock.patch("core.rabbitmq._connection"):
+            stock_client.breaker.reset()
+            port, stop = self.serve_asgi() if options["server"] == "asgi" else self.serve_wsgi()
+            try:
+                base = f"http://127.0.0.1:{port}"
+                self.drive(base, schedule[:options["warmup"]], options["concurrency"])
+                started = time.monotonic()
+                samples = self.drive(base, schedule[options["warmup"]:], options["concurrency"])
+                elapsed = time.monotonic() - started
+            finally:
+                stop()
+                stub.stop()
+                connection_created.disconnect(_install_query_counter)
+
+        results = {
+            "at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "config": {k: options[k] for k in (
+                "requests", "warmup", "concurrency", "mix", "restaurants", "page_size", "server",
+                "stock_latency_ms", "stock_jitter_ms", "stock_failure_rate", "no_cache", "seed",
+            )} | {"async_reads": options["server"] == "asgi" and async_reads},
+            "duration_s": round(elapsed, 3),
+            "routes": {route: self.summarise([s for s in samples if s[0] == route], elapsed) for route in mix},
+            "overall": self.summarise(samples, elapsed),
+            "stock_stub": stub.stats(),
+        }
+        self.report(results)
+        if options["compare"]:
+            with open(options["compare"]) as fh:
+                self.compare(json.load(fh), results)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def serve_wsgi(self):
+        """Serve the app with wsgiref on a free port; returns ``(port, stop)``."""
+        server = make_server(
+            "127.0.0.1", 0, QueryCountingApp(get_wsgi_application()),
+            server_class=_ThreadingWSGIServer, handler_class=_QuietHandler,
+        )
+        threading.Thread(target=server.serve_forever, name="benchmark-app", daemon=True).start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+
+        return server.server_address[1], stop
+
+    def serve_asgi(self):
+        """Serve the app with uvicorn on a free port; returns ``(port, stop)``."""
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        server = uvicorn.Server(uvicorn.Config(
+            QueryCountingASGIApp(get_asgi_application()), log_level="warning", access_log=False, lifespan="off",
+        ))
+        thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, name="benchmark-app", daemon=True)
+        thread.start()
+        while not server.started:
+            if not thread.is_alive():
+                raise RuntimeError("uvicorn failed to start")
+            time.sleep(0.01)
+
+        def stop():
+            server.should_exit = True
+            thread.join()
+            sock.close()
+
+        return sock.getsockname()[1], stop
+
+    def parse_mix(self, value):
+        mix = {}
+        for part in value.split(","):
+            route, _, weight = part.partition("=")
+            mix[route.strip()] = float(weight or 1)
+        return mix
+
+    def targets(self, rng, count):
+        """Sample restaurants with a few of their products, menus and search terms."""
+        restaurant_ids = sorted(set(Product.objects.values_list("restaurant_id", flat=True).distinct()))
+        chosen = rng.sample(restaurant_ids, min(count, len(restaurant_ids)))
+        targets = []
+        for rid in chosen:
+            products = list(Product.objects.filter(restaurant_id=rid).order_by("id").values_list("id", "name")[:50])
+            targets.append({
+                "restaurant_id": rid,
+                "product_ids": [pid for pid, _ in products],
+                "terms": [name.split()[0] for _, name in products if name.split()],
+                "menu_ids": list(Menu.objects.filter(restaurant_id=rid).order_by("id").values_list("id", flat=True)[:20]),
+            })
+        return targets
+
+    def schedule(self, rng, targets, mix, total, page_size):
+        """The ``(route, path)`` of every request, fixed up front so runs are comparable."""
+        routes = [r for r in mix if r != "menu" or any(t["menu_ids"] for t in targets)]
+        weights = [mix[r] for r in routes]
+        with_menus = [t for t in targets if t["menu_ids"]]
+        paging = f"page_size={page_size}" if page_size else ""
+        schedule = []
+        for _ in range(total):
+            route = rng.choices(routes, weights)[0]
+            target = rng.choice(with_menus if route == "menu" else targets)
+            path = ROUTES[route].format(
+                restaurant_id=target["restaurant_id"],
+                product_id=rng.choice(target["product_ids"]),
+                menu_id=rng.choice(target["menu_ids"]) if target["menu_ids"] else None,
+                term=rng.choice(target["terms"]) if target["terms"] else "",
+            )
+            if paging and route in ("list", "search"):
+                path += ("&" if "?" in path else "?") + paging
+            schedule.append((route, path))
+        return schedule
+
+    def drive(self, base, schedule, concurrency):
+        """Send ``schedule`` from ``concurrency`` clients; returns ``(route, status, seconds, queries)``."""
+        samples = []
+        lock = threading.Lock()
+        jobs = iter(schedule)
+
+        def client():
+            session = requests.Session()
+            while True:
+                with lock:
+                    job = next(jobs, None)
+                if job is None:
+                    return
+                route, path = job
+                started = time.perf_counter()
+                try:
+                    resp = session.get(base + path, timeout=30)
+                    status, queries = resp.status_code, resp.headers.get(QUERY_COUNT_HEADER)
+                except requests.RequestException:
+                    status, queries = None, None
+                sample = (route, status, time.perf_counter() - started, int(queries) if queries else None)
+                with lock:
+                    samples.append(sample)
+
+        threads = [threading.Thread(target=client, name=f"benchmark-client-{i}") for i in range(max(1, concurrency))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    def summarise(self, samples, elapsed):
+        latencies = sorted(s[2] * 1000 for s in samples)
+        queries = [s[3] for s in samples if s[3] is not None]
+
+        def ms(value):
+            return None if value is None else round(value, 2)
+
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for s in samples if s[1] is None or s[1] >= 400),
+            "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else None,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p95_ms": ms(percentile(latencies, 95)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "mean_ms": ms(statistics.fmean(latencies)) if latencies else None,
+            "queries_per_request": round(statistics.fmean(queries), 2) if queries else None,
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'route':<10}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+        rows = list(results["routes"].items()) + [("overall", results["overall"])]
+        for route, r in rows:
+            self.stdout.write(
+                f"{route:<10}{r['requests']:>7}{r['errors']:>8}{r['throughput_rps'] or 0:>9.1f}"
+                f"{r['p50_ms'] or 0:>9.1f}{r['p95_ms'] or 0:>9.1f}{r['p99_ms'] or 0:>9.1f}"
+                f"{r['queries_per_request'] or 0:>9.1f}"
+            )
+        stub = results["stock_stub"]
+        self.stdout.write(f"Stock stub: {stub['requests']} calls, {stub['failures']} failed")
+
+    def compare(self, baseline, results):
+        self.stdout.write(f"Compared with the run of {baseline.get('at', '?')}:")
+        for route, r in list(results["routes"].items()) + [("overall", results["overall"])]:
+            old = baseline["overall"] if route == "overall" else baseline.get("routes", {}).get(route)
+            if not old:
+                continue
+            changes = []
+            for key in ("p95_ms", "throughput_rps", "queries_per_request"):
+                if old.get(key) and r.get(key) is not None:
+                    changes.append(f"{key} {old[key]} -> {r[key]} ({(r[key] - old[key]) / old[key]:+.1%})")
+            self.stdout.write(f"  {route}: " + ", ".join(changes))
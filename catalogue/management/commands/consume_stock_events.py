@@ -1,18 +1,69 @@
-import decimal
-import json
+import collections
+import functools
+import time
+
 import pika
-import requests
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.utils import timezone
+from core import metrics
 from core.rabbitmq import RABBITMQ_EXCHANGE
-from catalogue.models import Product
+from catalogue.stock_events import KeyedDispatcher, apply_stock_events, event_time, parse_stock_event, product_key
+
+
+class AckTracker:
+    """Acks deliveries finished out of order with as few ``multiple=True`` acks as possible.
+
+    Only ever touched from the connection thread (worker threads go through
+    ``add_callback_threadsafe``). A tag is acked once it and every earlier
+    delivery are done.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.pending = collections.deque()
+        self.done = set()
+
+    def delivered(self, tag):
+        self.pending.append(tag)
+
+    def completed(self, tags):
+        self.done.update(tags)
+        last, acked = None, 0
+        while self.pending and self.pending[0] in self.done:
+            last = self.pending.popleft()
+            self.done.discard(last)
+            acked += 1
+        if last is not None:
+            self.channel.basic_ack(delivery_tag=last, multiple=True)
+            metrics.STOCK_EVENTS_ACKED.inc(acked)
 
 
 class Command(BaseCommand):
-    help = "Consume stock events"
+    help = (
+        "Consume stock events. Events for one product are applied in publish order as long as a single "
+        "process consumes the queue: the default exclusive queue, or --queue with --single-active, where "
+        "further processes stand by and take over on failure. --workers parallelises across products "
+        "within that process and keeps each product on one thread. Several active consumers on a shared "
+        "--queue may receive one product's events out of order; only timestamped events are then protected, "
+        "since one older than the product's last applied event is dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1, help="Messages applied together (1 = one at a time)")
+        parser.add_argument("--batch-ms", type=int, default=200, help="Longest wait, in ms, to fill a batch")
+        parser.add_argument("--prefetch", type=int, default=None, help="Unacked messages the broker may push (default: 2x batch size per worker)")
+        parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between throughput reports")
+        parser.add_argument("--queue", default="", help="Durable queue shared by several consumer processes (default: exclusive private queue)")
+        parser.add_argument("--single-active", action="store_true", help="Declare --queue with x-single-active-consumer: one process consumes at a time, so per-product order holds across processes")
+        parser.add_argument("--workers", type=int, default=0, help="Worker threads sharded by product id (0 = apply on the consumer thread)")
+        parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
 
     def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        batch_wait = options["batch_ms"] / 1000
+        workers = max(0, options["workers"])
+        metrics.serve(options["metrics_port"])
         creds = pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS)
         params = pika.ConnectionParameters(
             host=settings.RABBITMQ_HOST,
@@ -21,66 +72,101 @@ class Command(BaseCommand):
         )
         conn = pika.BlockingConnection(params)
         ch = conn.channel()
+        ch.basic_qos(prefetch_count=options["prefetch"] or batch_size * 2 * max(1, workers))
         ch.exchange_declare(exchange=RABBITMQ_EXCHANGE, exchange_type="topic", durable=True)
-        q = ch.queue_declare(queue="", exclusive=True)
+        if options["queue"]:
+            arguments = {"x-single-active-consumer": True} if options["single_active"] else None
+            q = ch.queue_declare(queue=options["queue"], durable=True, arguments=arguments)
+        else:
+            q = ch.queue_declare(queue="", exclusive=True)
         queue_name = q.method.queue
         ch.queue_bind(exchange=RABBITMQ_EXCHANGE, queue=queue_name, routing_key="stock.#")
 
-        def callback(ch, method, properties, body):
-            event = json.loads(body)
-            resource = event.get("resource")
-            action = event.get("action")
-            payload = event.get("payload") or {}
-            if resource != "products":
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                return
-
-            product_id = event.get("id") or payload.get("id")
-            name = payload.get("name")
-            restaurant_id = payload.get("restaurantId")
-
-            if action in ("created", "updated"):
-                if product_id is None or name is None or restaurant_id is None:
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    return
-
-                in_stock = True
-                base = getattr(settings, "STOCK_API_BASE", "").rstrip("/")
-                if base:
-                    try:
-                        url = f"{base}/products/{product_id}/availability/"
-                        resp = requests.get(url, timeout=2)
-                        if resp.status_code == 200:
-                            payload_av = resp.json()
-                            in_stock = bool(payload_av.get("available"))
-                    except Exception:
-                        in_stock = True
-
-                existing = Product.objects.filter(id=product_id).first()
-                if existing is None:
-                    Product.objects.create(
-                        id=product_id,
-                        name=name,
-                        restaurant_id=restaurant_id,
-                        description=None,
-                        image_url=None,
-                        price=decimal.Decimal("0.00"),
-                        available=in_stock,
-                        category=None,
-                        deleted_at=None,
-                    )
-                else:
-                    Product.objects.filter(id=product_id).update(
-                        name=name,
-                        restaurant_id=restaurant_id,
-                        available=in_stock,
-                        deleted_at=None,
-                    )
-
-            if action == "deleted":
-                Product.objects.filter(id=product_id).update(deleted_at=timezone.now())
-
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-
-        ch.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=False)
-        ch.start_consuming()
+        self.reset_report()
+        if workers:
+            self.consume_sharded(conn, ch, queue_name, workers, batch_size, batch_wait, options["report_interval"])
+        else:
+            self.consume_batched(ch, queue_name, batch_size, batch_wait, options["report_interval"])
+
+    def consume_batched(self, ch, queue_name, batch_size, batch_wait, report_interval):
+        batch, deliveries, last_tag, first_at = [], 0, None, None
+        for method, properties, body in ch.consume(queue_name, inactivity_timeout=batch_wait):
+            if method is not None:
+                event = parse_stock_event(body, properties.message_id, properties.content_type)
+                if event is not None:
+                    batch.append(event)
+                deliveries += 1
+                last_tag = method.delivery_tag
+                first_at = first_at or time.monotonic()
+            due = first_at is not None and (
+                len(batch) >= batch_size or method is None or time.monotonic() - first_at >= batch_wait
+            )
+            if due:
+                try:
+                    written = apply_stock_events(batch) if batch else 0
+                except Exception:
+                    metrics.STOCK_EVENTS_FAILED.inc(len(batch))
+                    raise
+                self.applied_batch(batch, written)
+                # one ack covers every delivery up to and including the last one of the batch
+                ch.basic_ack(delivery_tag=last_tag, multiple=True)
+                metrics.STOCK_EVENTS_ACKED.inc(deliveries)
+                batch, deliveries, last_tag, first_at = [], 0, None, None
+            self.maybe_report(report_interval)
+
+    def consume_sharded(self, conn, ch, queue_name, workers, batch_size, batch_wait, report_interval):
+        tracker = AckTracker(ch)
+
+        def done(tags, events, written):
+            self.applied_batch(events, written)
+            tracker.completed(tags)
+
+        dispatcher = KeyedDispatcher(
+            workers,
+            on_done=lambda *result: conn.add_callback_threadsafe(functools.partial(done, *result)),
+            batch_size=batch_size,
+            batch_wait=batch_wait,
+        )
+        try:
+            for method, properties, body in ch.consume(queue_name, inactivity_timeout=batch_wait):
+                if dispatcher.error is not None:
+                    raise dispatcher.error
+                if method is not None:
+                    tracker.delivered(method.delivery_tag)
+                    event = parse_stock_event(body, properties.message_id, properties.content_type)
+                    key = product_key(event)
+                    if key is None:
+                        tracker.completed([method.delivery_tag])
+                    else:
+                        dispatcher.submit(key, method.delivery_tag, event)
+                self.maybe_report(report_interval)
+        finally:
+            dispatcher.close()
+
+    def applied_batch(self, batch, written):
+        if batch:
+            metrics.STOCK_EVENTS_PROCESSED.inc(len(batch))
+            metrics.STOCK_EVENT_BATCH_SIZE.observe(len(batch))
+        self.applied += len(batch)
+        self.written += written
+        stamps = [t for t in map(event_time, batch) if t is not None]
+        if stamps:
+            self.lag = (timezone.now() - min(stamps)).total_seconds()
+
+    def reset_report(self):
+        self.applied = 0
+        self.written = 0
+        self.lag = None
+        self.window_start = time.monotonic()
+
+    def maybe_report(self, interval):
+        elapsed = time.monotonic() - self.window_start
+        if elapsed < interval:
+            return
+        if self.applied:
+            lag = f", lag {self.lag:.3f}s" if self.lag is not None else ""
+            self.stdout.write(
+                f"Applied {self.applied} stock events ({self.applied / elapsed:.1f}/s), "
+                f"wrote {self.written} products{lag}"
+            )
+        self.reset_report()
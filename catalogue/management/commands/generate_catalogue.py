@@ -0,0 +1,200 @@
+import decimal
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from catalogue.models import Category, CategoryMenu, Menu, Product, ProductCategory, ProductCategoryMenu
+from catalogue.signals import touch
+
+WORDS = [
+    "poulet", "boeuf", "saumon", "thon", "tofu", "fromage", "tomate", "basilic", "avocat", "bacon",
+    "champignon", "épicé", "grillé", "croustillant", "maison", "truffe", "citron", "curry", "sésame", "miel",
+    "chocolat", "vanille", "caramel", "pistache", "fraise", "mangue", "coco", "menthe", "piment", "ail",
+]
+DISHES = [
+    "Burger", "Pizza", "Salade", "Wrap", "Bowl", "Sushi", "Maki", "Tacos", "Pâtes", "Soupe",
+    "Sandwich", "Curry", "Ramen", "Poke", "Quiche", "Tarte", "Glace", "Cookie", "Smoothie", "Jus",
+]
+SECTIONS = ["Entrées", "Plats", "Desserts", "Boissons", "Accompagnements", "Sauces", "Formules", "Nouveautés"]
+# a restaurant's size is capped at this multiple of the mean, so one outlier cannot dominate a run
+MAX_SIZE_FACTOR = 20
+
+
+def zipf_weights(n, exponent):
+    """Popularity weights of ``n`` ranked items: item ``k`` is ``1 / (k + 1) ** exponent``."""
+    return [1 / (k + 1) ** exponent for k in range(n)]
+
+
+def section_name(n):
+    """``Entrées``, ``Plats``, ... then ``Entrées 2``, ``Plats 2``, ... for larger restaurants."""
+    name = SECTIONS[n % len(SECTIONS)]
+    return name if n < len(SECTIONS) else f"{name} {n // len(SECTIONS) + 1}"
+
+
+class Command(BaseCommand):
+    help = "Generate a large synthetic catalogue with bulk inserts, for benchmarks and query plans"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restaurants", type=int, default=100, help="Restaurants to generate")
+        parser.add_argument("--first-restaurant-id", type=int, default=1000, help="Id of the first generated restaurant")
+        parser.add_argument("--categories", type=int, default=12, help="Mean categories per restaurant")
+        parser.add_argument("--products", type=int, default=250, help="Mean products per restaurant")
+        parser.add_argument("--menus", type=int, default=4, help="Mean menus per restaurant")
+        parser.add_argument("--menu-categories", type=int, default=3, help="Categories per menu")
+        parser.add_argument("--menu-products", type=int, default=6, help="Products offered per menu category")
+        parser.add_argument("--skew", type=float, default=1.5, help="Pareto shape of restaurant sizes (lower = more skewed)")
+        parser.add_argument("--popularity", type=float, default=1.1, help="Zipf exponent of category and product popularity")
+        parser.add_argument("--deleted-ratio", type=float, default=0.02, help="Share of products soft-deleted")
+        parser.add_argument("--unavailable-ratio", type=float, default=0.05, help="Share of products out of stock")
+        parser.add_argument("--seed", type=int, default=0, help="Seed; the same seed and options give the same catalogue")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per INSERT and products per transaction")
+
+    def handle(self, *args, **options):
+        self.options = options
+        first = options["first_restaurant_id"]
+        restaurant_ids = [str(rid) for rid in range(first, first + max(0, options["restaurants"]))]
+        if Product.all_objects.filter(restaurant_id__in=restaurant_ids).exists():
+            self.stderr.write(
+                f"Restaurants {restaurant_ids[0]}..{restaurant_ids[-1]} already have products; "
+                "pick another --first-restaurant-id."
+            )
+            return
+
+        chunk_size = max(1, options["chunk_size"])
+        self.rows = 0
+        started = time.monotonic()
+        group, planned = [], 0
+        for rid in restaurant_ids:
+            plan = self.plan(rid)
+            group.append(plan)
+            planned += plan["products"]
+            if planned >= chunk_size:
+                self.write_group(group)
+                group, planned = [], 0
+                self.progress(started)
+        if group:
+            self.write_group(group)
+        with transaction.atomic():
+            touch(restaurant_ids)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {self.rows} rows for {len(restaurant_ids)} restaurants "
+            f"in {elapsed:.1f}s ({self.rows / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
+
+    def progress(self, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{self.rows} rows ({self.rows / elapsed if elapsed else 0:.0f} rows/s)")
+
+    def plan(self, restaurant_id):
+        """Draw the size of one restaurant from its own seeded generator."""
+        rng = random.Random(f"{self.options['seed']}:{restaurant_id}")
+        shape = max(1.01, self.options["skew"])
+        # pareto sizes normalised to a mean of 1: a few large restaurants, a long tail of small ones
+        factor = min(MAX_SIZE_FACTOR, rng.paretovariate(shape) * (shape - 1) / shape)
+        return {
+            "restaurant_id": restaurant_id,
+            "rng": rng,
+            "categories": max(1, round(self.options["categories"] * factor ** 0.5)),
+            "products": max(1, round(self.options["products"] * factor)),
+            "menus": max(0, round(self.options["menus"] * factor ** 0.5)),
+        }
+
+    def write_group(self, group):
+        """Insert a group of restaurants, parents before the rows that reference them."""
+        opts = self.options
+        batch = max(1, opts["chunk_size"])
+        now = timezone.now()
+        with transaction.atomic():
+            categories = []
+            for plan in group:
+                rng = plan["rng"]
+                plan["category_objs"] = [
+                    Category(
+                        restaurant_id=plan["restaurant_id"],
+                        name=section_name(i),
+                        description=" ".join(rng.sample(WORDS, 3)),
+                    )
+                    for i in range(plan["categories"])
+                ]
+                categories.extend(plan["category_objs"])
+            Category.all_objects.bulk_create(categories, batch_size=batch)
+
+            products = []
+            for plan in group:
+                rng = plan["rng"]
+                cats = plan["category_objs"]
+                weights = zipf_weights(len(cats), opts["popularity"])
+                plan["product_objs"] = []
+                for n in range(plan["products"]):
+                    words = rng.sample(WORDS, 2)
+                    product = Product(
+                        restaurant_id=plan["restaurant_id"],
+                        name=f"{rng.choice(DISHES)} {words[0]} {words[1]} {n}",
+                        description=" ".join(rng.sample(WORDS, rng.randint(3, 8))),
+                        price=decimal.Decimal(rng.randint(150, 3500)) / 100,
+                        category_id=rng.choices(cats, weights)[0].id,
+                        available=rng.random() >= opts["unavailable_ratio"],
+                        deleted_at=now if rng.random() < opts["deleted_ratio"] else None,
+                    )
+                    plan["product_objs"].append(product)
+                products.extend(plan["product_objs"])
+            Product.all_objects.bulk_create(products, batch_size=batch)
+
+            links = []
+            for plan in group:
+                rng = plan["rng"]
+                cats = plan["category_objs"]
+                for product in plan["product_objs"]:
+                    linked = {product.category_id}
+                    # about one product in five is listed under a second category
+                    if len(cats) > 1 and rng.random() < 0.2:
+                        linked.add(rng.choice(cats).id)
+                    links.extend(ProductCategory(product_id=product.id, category_id=cid) for cid in sorted(linked))
+            ProductCategory.objects.bulk_create(links, batch_size=batch)
+
+            menus = []
+            for plan in group:
+                rng = plan["rng"]
+                plan["menu_objs"] = [
+                    Menu(
+                        restaurant_id=plan["restaurant_id"],
+                        name=f"Menu {rng.choice(DISHES)} {i + 1}",
+                        description=" ".join(rng.sample(WORDS, 4)),
+                        price=decimal.Decimal(rng.randint(800, 4500)) / 100,
+                    )
+                    for i in range(plan["menus"])
+                ]
+                menus.extend(plan["menu_objs"])
+            Menu.all_objects.bulk_create(menus, batch_size=batch)
+
+            menu_categories = []
+            for plan in group:
+                plan["menu_category_objs"] = [
+                    CategoryMenu(menu_id=menu.id, name=section_name(i), quantity=1)
+                    for menu in plan["menu_objs"]
+                    for i in range(opts["menu_categories"])
+                ]
+                menu_categories.extend(plan["menu_category_objs"])
+            CategoryMenu.objects.bulk_create(menu_categories, batch_size=batch)
+
+            menu_links = []
+            for plan in group:
+                rng = plan["rng"]
+                live = [p for p in plan["product_objs"] if p.deleted_at is None] or plan["product_objs"]
+                weights = zipf_weights(len(live), opts["popularity"])
+                for menu_category in plan["menu_category_objs"]:
+                    # popular products show up in many menus, duplicates within one category collapse
+                    picked = {p.id for p in rng.choices(live, weights, k=opts["menu_products"])}
+                    menu_links.extend(
+                        ProductCategoryMenu(category_id=menu_category.id, product_id=pid) for pid in sorted(picked)
+                    )
+            ProductCategoryMenu.objects.bulk_create(menu_links, batch_size=batch)
+
+        self.rows += (
+            len(categories) + len(products) + len(links) + len(menus) + len(menu_categories) + len(menu_links)
+        )
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from pika.exceptions import AMQPError
+
+from core import metrics
+from core.rabbitmq import publisher
+from catalogue.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = "Relay catalogue outbox events to RabbitMQ"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Events claimed per transaction")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between throughput reports")
+        parser.add_argument("--once", action="store_true", help="Drain the outbox and exit; exits non-zero if a publish fails")
+        parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+
+    def relay_batch(self, batch_size):
+        """Publish and delete the oldest unclaimed events.
+
+        Rows are claimed with ``FOR UPDATE SKIP LOCKED`` so several relays can
+        drain the outbox in parallel; a failed publish rolls the claim back.
+        Returns ``(count, lag_seconds)``.
+        """
+        with transaction.atomic():
+            rows = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size]
+            )
+            if not rows:
+                return 0, 0.0
+            publisher.publish_many([(row.routing_key, row.payload) for row in rows])
+            OutboxEvent.objects.filter(id__in=[row.id for row in rows]).delete()
+        lag = (timezone.now() - rows[0].created_at).total_seconds()
+        return len(rows), lag
+
+    def handle(self, *args, **options):
+        metrics.serve(options["metrics_port"])
+        batch_size = options["batch_size"]
+        relayed = 0
+        lag = 0.0
+        window_start = time.monotonic()
+        while True:
+            try:
+                count, batch_lag = self.relay_batch(batch_size)
+            except (AMQPError, OSError) as exc:
+                # the claim was rolled back, so the events are still in the outbox
+                if options["once"]:
+                    raise CommandError(f"Publish failed, events left in the outbox: {exc}") from exc
+                self.stderr.write(f"Publish failed, will retry: {exc}")
+                count, batch_lag = 0, lag
+            relayed += count
+            if count:
+                lag = batch_lag
+            drained = count < batch_size
+
+            elapsed = time.monotonic() - window_start
+            if relayed and (elapsed >= options["report_interval"] or (drained and options["once"])):
+                depth = OutboxEvent.objects.count()
+                metrics.OUTBOX_DEPTH.set(depth)
+                self.stdout.write(
+                    f"Relayed {relayed} events ({relayed / elapsed:.1f}/s), lag {lag:.3f}s, {depth} waiting"
+                )
+                relayed = 0
+                window_start = time.monotonic()
+
+            if drained:
+                if count:
+                    metrics.OUTBOX_DEPTH.set(0)
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
@@ -8,9 +8,9 @@ class Command(BaseCommand):
         self.stdout.write('Seeding catalogue... clearing old data...')
 
         ProductCategory.objects.all().delete()
-        Product.objects.all().delete()
-        Category.objects.all().delete()
-        Menu.objects.all().delete()
+        Product.all_objects.all().delete()
+        Category.all_objects.all().delete()
+        Menu.all_objects.all().delete()
 
         # Restaurant 1: Pizza Paradise
         # Categories
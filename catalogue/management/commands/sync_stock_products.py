@@ -1,72 +1,185 @@
 import decimal
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import requests
-from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
 
-from catalogue.models import Product
+from catalogue.models import Category, Menu, Product
+from catalogue.signals import event_batch, record, touch
+from catalogue.stock_client import StockUnavailable, stock_client
+
+# the Stock API owns these columns; price, description, image and categories stay catalogue-owned.
+# ``deleted_at`` is left alone: a product list does not say a soft-deleted product is live again.
+STOCK_FIELDS = ["name", "restaurant_id", "updated_at"]
+
+
+class SyncFailed(Exception):
+    pass
 
 
 class Command(BaseCommand):
     help = "Sync products from stock service into catalogue"
 
     def add_arguments(self, parser):
-        parser.add_argument(
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument(
             "--restaurant-id",
-            type=int,
-            required=True,
+            type=str,
             help="Restaurant ID to sync products for",
         )
+        target.add_argument(
+            "--all-restaurants",
+            action="store_true",
+            help=(
+                "Sync every restaurant the catalogue already has products, categories or menus for; "
+                "restaurants that only exist in the Stock API are not imported (use --restaurant-id)"
+            ),
+        )
+        parser.add_argument("--page-size", type=int, default=500, help="Products requested per Stock API page")
+        parser.add_argument("--workers", type=int, default=4, help="Restaurants synced concurrently with --all-restaurants")
 
-    def handle(self, *args, **options):
-        restaurant_id = options["restaurant_id"]
-        base = getattr(settings, "STOCK_API_BASE", "").rstrip("/")
-        if not base:
-            self.stderr.write("STOCK_API_BASE is not configured.")
-            return
-
-        url = f"{base}/products/"
-        params = {"restaurantId": restaurant_id}
+    def pages(self, restaurant_id, page_size):
+        """Yield ``(items, fetched_at)`` per Stock API page, following ``next`` on paginated answers.
 
-        try:
-            resp = requests.get(url, params=params, timeout=5)
-        except requests.RequestException as exc:
-            self.stderr.write(f"Stock API request failed: {exc}")
-            return
+        ``next`` is requested as given, whatever the pagination style, but must
+        stay under ``STOCK_API_BASE``.
+        """
+        path = "products/"
+        params = {"restaurantId": restaurant_id, "page_size": page_size}
+        while True:
+            fetched_at = timezone.now()
+            try:
+                resp = stock_client.get(path, params=params, timeout=5)
+            except StockUnavailable as exc:
+                raise SyncFailed(f"Stock API request failed: {exc}") from exc
+            if resp.status_code != 200:
+                raise SyncFailed(f"Stock API returned {resp.status_code}: {resp.text}")
 
-        if resp.status_code != 200:
-            self.stderr.write(f"Stock API returned {resp.status_code}: {resp.text}")
-            return
+            payload = resp.json()
+            items = payload.get("results") if isinstance(payload, dict) else payload
+            if not isinstance(items, list):
+                raise SyncFailed("Unexpected response format from Stock API.")
+            yield items, fetched_at
+            # a bare list is an unpaginated answer
+            next_url = payload.get("next") if isinstance(payload, dict) else None
+            if not next_url or not items:
+                return
+            if not next_url.startswith(f"{stock_client.base}/"):
+                raise SyncFailed(f"Stock API 'next' link is outside STOCK_API_BASE: {next_url}")
+            # the link carries its own query string
+            path, params = next_url[len(stock_client.base) + 1:], None
 
-        payload = resp.json()
-        items = payload.get("results") if isinstance(payload, dict) else payload
-        if not isinstance(items, list):
-            self.stderr.write("Unexpected response format from Stock API.")
-            return
+    def upsert(self, items, snapshot):
+        """Upsert one page with a single INSERT ... ON CONFLICT; returns ``(created, updated)``.
 
-        created = 0
-        updated = 0
+        Products a stock event changed after ``snapshot`` (the time the page was
+        requested) are skipped: the page is older than what they hold.
+        """
+        rows = {}
         for item in items:
-            pid = item.get("id")
             name = item.get("name")
             rid = item.get("restaurantId")
-            if pid is None or name is None or rid is None:
+            try:
+                pid = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            if name is None or rid is None:
                 continue
-            obj, was_created = Product.objects.update_or_create(
+            rows[pid] = Product(
                 id=pid,
-                defaults={
-                    "name": name,
-                    "restaurant_id": rid,
-                    "description": None,
-                    "image_url": None,
-                    "price": decimal.Decimal("0.00"),
-                    "available": True,
-                    "category": None,
-                },
+                name=name,
+                restaurant_id=str(rid),
+                price=decimal.Decimal("0.00"),
+                deleted_at=None,
             )
-            if was_created:
-                created += 1
-            else:
-                updated += 1
+        if not rows:
+            return 0, 0
 
-        self.stdout.write(f"Synced products for restaurant {restaurant_id}. Created: {created}, Updated: {updated}")
+        with transaction.atomic(), event_batch():
+            previous = {}
+            for pid, rid, event_at in (
+                Product.all_objects.select_for_update()
+                .filter(id__in=list(rows)).values_list("id", "restaurant_id", "stock_event_at")
+            ):
+                if event_at is not None and event_at > snapshot:
+                    del rows[pid]
+                else:
+                    previous[pid] = rid
+            if not rows:
+                return 0, 0
+            Product.all_objects.bulk_create(
+                rows.values(),
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=STOCK_FIELDS,
+            )
+            # rows that moved restaurant must invalidate the one they left
+            moved_from = {rid for pid, rid in previous.items() if rid != rows[pid].restaurant_id}
+            if moved_from:
+                touch(moved_from)
+            for product in Product.all_objects.filter(id__in=rows).prefetch_related("categories"):
+                record(product, "updated" if product.id in previous else "created")
+        return len(rows) - len(previous), len(previous)
+
+    def sync_restaurant(self, restaurant_id, page_size):
+        created = updated = 0
+        for items, fetched_at in self.pages(restaurant_id, page_size):
+            page_created, page_updated = self.upsert(items, fetched_at)
+            created += page_created
+            updated += page_updated
+        return created, updated
+
+    def _sync_in_thread(self, restaurant_id, page_size):
+        try:
+            return self.sync_restaurant(restaurant_id, page_size)
+        finally:
+            connection.close()
+
+    def restaurant_ids(self):
+        ids = set(Product.all_objects.values_list("restaurant_id", flat=True).distinct())
+        ids.update(Category.all_objects.values_list("restaurant_id", flat=True).distinct())
+        ids.update(Menu.all_objects.values_list("restaurant_id", flat=True).distinct())
+        return sorted(ids)
+
+    def handle(self, *args, **options):
+        if not stock_client.base:
+            self.stderr.write("STOCK_API_BASE is not configured.")
+            return
+
+        page_size = options["page_size"]
+        started = time.monotonic()
+        if not options["all_restaurants"]:
+            restaurant_id = options["restaurant_id"]
+            try:
+                created, updated = self.sync_restaurant(restaurant_id, page_size)
+            except SyncFailed as exc:
+                self.stderr.write(str(exc))
+                return
+            self.stdout.write(f"Synced products for restaurant {restaurant_id}. Created: {created}, Updated: {updated}")
+            return
+
+        restaurant_ids = self.restaurant_ids()
+        created = updated = failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"]), thread_name_prefix="stock-sync") as pool:
+            futures = {pool.submit(self._sync_in_thread, rid, page_size): rid for rid in restaurant_ids}
+            for future in as_completed(futures):
+                rid = futures[future]
+                try:
+                    r_created, r_updated = future.result()
+                except SyncFailed as exc:
+                    failed += 1
+                    self.stderr.write(f"Restaurant {rid}: {exc}")
+                    continue
+                created += r_created
+                updated += r_updated
+                self.stdout.write(f"Synced products for restaurant {rid}. Created: {r_created}, Updated: {r_updated}")
+
+        elapsed = time.monotonic() - started
+        rows = created + updated
+        self.stdout.write(
+            f"Synced {rows} products for {len(restaurant_ids) - failed}/{len(restaurant_ids)} restaurants "
+            f"in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.1f} rows/s). "
+            f"Created: {created}, Updated: {updated}"
+        )
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:11
+
+import catalogue.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0002_alter_category_restaurant_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('routing_key', models.CharField(db_column='routingKey', max_length=255)),
+                ('payload', models.JSONField(encoder=catalogue.models.EventJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_column='createdAt')),
+            ],
+            options={
+                'db_table': 'outbox_events',
+            },
+        ),
+    ]
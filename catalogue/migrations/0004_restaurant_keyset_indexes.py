@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0003_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['restaurant_id', 'id'], name='categories_rest_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(fields=['restaurant_id', 'id'], name='menus_rest_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['restaurant_id', 'id'], name='products_rest_id_idx'),
+        ),
+    ]
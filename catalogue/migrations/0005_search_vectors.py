@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:17
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_TABLES = ('products', 'categories', 'menus')
+
+SETUP_SQL = """
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'french_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION french_unaccent (COPY = french);
+        ALTER TEXT SEARCH CONFIGURATION french_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+    END IF;
+END
+$$;
+CREATE OR REPLACE FUNCTION catalogue_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT unaccent('unaccent'::regdictionary, $1) $$;
+CREATE OR REPLACE FUNCTION catalogue_search_vector() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW."searchVector" IS NULL
+       OR NEW.name IS DISTINCT FROM OLD.name
+       OR NEW.description IS DISTINCT FROM OLD.description THEN
+        NEW."searchVector" :=
+            setweight(to_tsvector('french_unaccent', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('french_unaccent', coalesce(NEW.description, '')), 'B');
+    END IF;
+    RETURN NEW;
+END
+$$;
+"""
+
+TABLE_SQL = """
+DROP TRIGGER IF EXISTS {table}_search_vector ON {table};
+CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE ON {table}
+    FOR EACH ROW EXECUTE FUNCTION catalogue_search_vector();
+UPDATE {table} SET "searchVector" = NULL;
+CREATE INDEX IF NOT EXISTS {table}_search_gin ON {table} USING gin ("searchVector");
+CREATE INDEX IF NOT EXISTS {table}_name_trgm ON {table} USING gin (catalogue_unaccent(name) gin_trgm_ops);
+"""
+
+TEARDOWN_SQL = """
+DROP INDEX IF EXISTS {table}_name_trgm;
+DROP INDEX IF EXISTS {table}_search_gin;
+DROP TRIGGER IF EXISTS {table}_search_vector ON {table};
+"""
+
+
+def create_search_support(apps, schema_editor):
+    # full-text/trigram support is PostgreSQL only; SQLite keeps the NULL column
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(SETUP_SQL)
+    for table in SEARCH_TABLES:
+        schema_editor.execute(TABLE_SQL.format(table=table))
+
+
+def drop_search_support(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(TEARDOWN_SQL.format(table=table))
+    schema_editor.execute("DROP FUNCTION IF EXISTS catalogue_search_vector()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0004_restaurant_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(db_column='searchVector', editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='menu',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(db_column='searchVector', editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(db_column='searchVector', editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_support, drop_search_support),
+    ]
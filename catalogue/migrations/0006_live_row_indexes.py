@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0005_search_vectors'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='category',
+            name='categories_rest_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menus_rest_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_rest_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['restaurant_id', 'id'], name='categories_live_rest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['restaurant_id', 'id'], name='menus_live_rest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['restaurant_id', 'id'], name='products_live_rest_idx'),
+        ),
+    ]
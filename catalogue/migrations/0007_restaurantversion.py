@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0006_live_row_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantVersion',
+            fields=[
+                ('restaurant_id', models.CharField(db_column='restaurantId', max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(db_column='updatedAt')),
+            ],
+            options={
+                'db_table': 'restaurant_versions',
+            },
+        ),
+    ]
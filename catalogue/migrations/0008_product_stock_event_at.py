@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0007_restaurantversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_event_at',
+            field=models.DateTimeField(blank=True, db_column='stockEventAt', editable=False, null=True),
+        ),
+    ]
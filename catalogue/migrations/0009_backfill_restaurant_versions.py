@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def seed_versions(apps, schema_editor):
+    """One version row per restaurant with data, so reads never have to create it."""
+    RestaurantVersion = apps.get_model('catalogue', 'RestaurantVersion')
+    last = {}
+    for name in ('Product', 'Category', 'Menu'):
+        model = apps.get_model('catalogue', name)
+        rows = model._base_manager.values('restaurant_id').annotate(last=Max('updated_at'))
+        for row in rows:
+            rid = str(row['restaurant_id'])
+            if rid not in last or row['last'] > last[rid]:
+                last[rid] = row['last']
+    RestaurantVersion.objects.bulk_create(
+        [RestaurantVersion(restaurant_id=rid, version=0, updated_at=at) for rid, at in last.items()],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogue', '0008_product_stock_event_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_versions, migrations.RunPython.noop),
+    ]
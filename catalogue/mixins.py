@@ -0,0 +1,270 @@
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import RestaurantVersion
+from .response_cache import GLOBAL_SCOPE, menu_scope, response_cache, restaurant_scope
+from .serializers import ValuesRepresentation
+from .signals import event_batch
+
+
+class RestaurantConditionalMixin:
+    """ETag / Last-Modified handling for reads under ``restaurants/<restaurant_id>/``.
+
+    The validator is the restaurant's ``RestaurantVersion`` row, bumped by
+    ``catalogue.signals`` on every write, so a ``304 Not Modified`` costs one
+    primary-key lookup and no serialization.
+    """
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        rid = self.kwargs.get('restaurant_id')
+        if rid is None or request.method not in ('GET', 'HEAD'):
+            return handler(request, *args, **kwargs)
+        version = RestaurantVersion.objects.current(rid)
+        last_modified = int(version.updated_at.timestamp())
+        response = get_conditional_response(request, etag=version.etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = version.etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
+
+class CachedResponseMixin:
+    """Serve ``list``/``retrieve`` from the Redis response cache.
+
+    Responses are scoped to the menu or restaurant in the URL (or ``global``),
+    and ``catalogue.signals`` bumps those scopes on every write.
+    """
+
+    def cache_scope(self):
+        menu_id = self.kwargs.get('menu_id')
+        if menu_id is not None:
+            return menu_scope(menu_id)
+        rid = self.kwargs.get('restaurant_id') or self.request.query_params.get('restaurant_id') or self.request.query_params.get('restaurant')
+        if rid is not None:
+            return restaurant_scope(rid)
+        return GLOBAL_SCOPE
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        built = {}
+
+        def build():
+            built['response'] = response = handler(request, *args, **kwargs)
+            return response.data, response.status_code == 200
+
+        data = response_cache.fetch(self.cache_scope(), request, build)
+        return built.get('response') or Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+
+class SparseFieldsMixin:
+    """``?fields=`` / ``?omit=`` on ``list``/``retrieve``: comma-separated output fields to keep / drop.
+
+    The serializer loses the other fields and the queryset loads only the
+    columns behind the kept ones (``.only()``, or the ``.values()`` columns of
+    ``ValuesReadMixin``), without the prefetches of relations left out.
+    ``extra_fields`` maps outputs the view adds itself to the field they are
+    computed from, which is kept with them (``in_stock`` needs ``id``); the
+    view checks ``wants()`` before computing them. Unknown names are a 400.
+    """
+    extra_fields = {}
+    _field_sources = {}
+
+    def field_sources(self):
+        """``{output field: source}`` of the serializer's readable fields."""
+        serializer_class = self.get_serializer_class()
+        sources = self._field_sources.get(serializer_class)
+        if sources is None:
+            sources = {name: field.source for name, field in serializer_class().fields.items() if not field.write_only}
+            self._field_sources[serializer_class] = sources
+        return sources
+
+    def requested_fields(self):
+        """The output fields of this read, or ``None`` for all of them."""
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = self._parse_fields()
+        return self._requested_fields
+
+    def _parse_fields(self):
+        params = self.request.query_params
+        if self.action not in ('list', 'retrieve') or not (params.get('fields') or params.get('omit')):
+            return None
+        available = {*self.field_sources(), *self.extra_fields}
+        errors = {}
+        selected = available
+        for param in ('fields', 'omit'):
+            names = {name.strip() for name in params.get(param, '').split(',') if name.strip()}
+            unknown = sorted(names - available)
+            if unknown:
+                errors[param] = [f"Unknown field(s): {', '.join(unknown)}."]
+            elif names:
+                selected = selected & names if param == 'fields' else selected - names
+        if errors:
+            raise ValidationError(errors)
+        return selected | {self.extra_fields[name] for name in selected if name in self.extra_fields}
+
+    def wants(self, name):
+        fields = self.requested_fields()
+        return fields is None or name in fields
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.requested_fields()
+        if fields is not None:
+            child = getattr(serializer, 'child', serializer)
+            for name in [name for name in child.fields if name not in fields]:
+                child.fields.pop(name)
+        return serializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.requested_fields()
+        if fields is None:
+            return queryset
+        model = queryset.model
+        field_sources = self.field_sources()
+        sources = {field_sources[name] for name in fields if name in field_sources}
+        prefetches = [
+            lookup for lookup in queryset._prefetch_related_lookups
+            if getattr(lookup, 'prefetch_through', lookup).split('__')[0] in sources
+        ]
+        queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+        try:
+            columns = [model._meta.get_field(source) for source in sources]
+        except FieldDoesNotExist:
+            # a computed field may read any column
+            return queryset
+        return queryset.only(
+            model._meta.pk.name, *(field.name for field in columns if field.concrete and not field.many_to_many)
+        )
+
+    def values_representation(self):
+        representation = super().values_representation()
+        fields = self.requested_fields()
+        return representation if representation is None or fields is None else representation.narrow(fields)
+
+
+class ValuesReadMixin:
+    """``list``/``retrieve`` built from ``.values()`` rows by ``ValuesRepresentation``.
+
+    The output is the serializer's, without its per-field machinery; viewsets
+    whose serializer it cannot reproduce keep the stock ``list``/``retrieve``.
+    """
+
+    def values_representation(self):
+        return ValuesRepresentation.of(self.get_serializer_class())
+
+    def read_queryset(self):
+        """The filtered queryset of a read, as ``.values()`` rows when the fast path applies."""
+        queryset = self.filter_queryset(self.get_queryset())
+        representation = self.values_representation()
+        return queryset if representation is None else representation.rows(queryset)
+
+    def read_object(self):
+        """``get_object()`` for reads: the looked-up row, as a ``.values()`` dict when the fast path applies."""
+        if self.values_representation() is None:
+            return self.get_object()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(self.read_queryset(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(self.request, row)
+        return row
+
+    def represent(self, rows, many=False):
+        representation = self.values_representation()
+        if representation is None:
+            return self.get_serializer(rows, many=many).data
+        return representation.many(rows) if many else representation.one(rows)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.read_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.represent(page, many=True))
+        return Response(self.represent(queryset, many=True))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.represent(self.read_object()))
+
+
+class EventBatchWriteMixin:
+    """Run each write request in one transaction and one event batch.
+
+    A request that saves a row and then sets its links emits one event per
+    entity, in its final state; the outbox rows and the version bump are
+    written just before the commit, so they commit or roll back with the
+    data. Error responses roll the request back.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return super().dispatch(request, *args, **kwargs)
+        with transaction.atomic(), event_batch():
+            response = super().dispatch(request, *args, **kwargs)
+            if getattr(response, 'exception', False):
+                transaction.set_rollback(True)
+        return response
+
+
+class BulkWriteMixin:
+    """``<route>/bulk/``: write many rows in one transaction and one event batch.
+
+    ``POST`` takes a list of new rows, ``PATCH`` a list of partial rows carrying
+    their ``id``, ``DELETE`` a ``{"ids": [...]}`` body. The payload is validated
+    as a whole by ``bulk_serializer_class`` before anything is written.
+    """
+    bulk_serializer_class = None
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        if request.method == 'DELETE':
+            return self.bulk_destroy(request)
+        partial = request.method == 'PATCH'
+        with transaction.atomic(), event_batch():
+            instance = None
+            if partial:
+                instance = self.get_queryset().prefetch_related(None).select_for_update(of=('self',))
+            serializer = self.bulk_serializer_class(
+                instance,
+                data=request.data,
+                many=True,
+                partial=partial,
+                allow_empty=False,
+                max_length=getattr(settings, 'CATALOGUE_BULK_MAX_ITEMS', 1000),
+                context=self.get_serializer_context(),
+            )
+            serializer.is_valid(raise_exception=True)
+            ids = [obj.id for obj in serializer.save()]
+        rows = self.get_queryset().filter(id__in=ids).order_by('id')
+        return Response(
+            self.get_serializer(rows, many=True).data,
+            status=status.HTTP_200_OK if partial else status.HTTP_201_CREATED,
+        )
+
+    def bulk_destroy(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
+            raise ValidationError({'ids': ['Expected a non-empty list of ids.']})
+        with transaction.atomic(), event_batch():
+            self.get_queryset().prefetch_related(None).filter(id__in=ids).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,17 +1,48 @@
-from django.db import models
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+class SearchableModel(models.Model):
+    """Adds a ``tsvector`` of name + description.
+
+    On PostgreSQL the column is maintained by a trigger (see migration 0005) using
+    the accent-insensitive ``french_unaccent`` configuration; elsewhere it stays NULL.
+    """
+    search_vector = SearchVectorField(null=True, editable=False, db_column='searchVector')
+
+    class Meta:
+        abstract = True
+
+
+class LiveManager(models.Manager):
+    """Hides soft-deleted rows (``deletedAt`` set)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class TimestampedModel(models.Model):
-    """Abstract model to add createdAt / updatedAt / deletedAt columns with exact DB column names."""
+    """Abstract model to add createdAt / updatedAt / deletedAt columns with exact DB column names.
+
+    ``objects`` only sees live rows; sync consumers that must see tombstones use ``all_objects``.
+    """
     created_at = models.DateTimeField(auto_now_add=True, db_column='createdAt')
     updated_at = models.DateTimeField(auto_now=True, db_column='updatedAt')
     deleted_at = models.DateTimeField(null=True, blank=True, db_column='deletedAt')
 
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         abstract = True
 
 
-class Menu(TimestampedModel):
+class Menu(SearchableModel, TimestampedModel):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     image_url = models.URLField(max_length=500, blank=True, null=True, db_column='imageUrl')
@@ -20,12 +51,15 @@ class Menu(TimestampedModel):
 
     class Meta:
         db_table = 'menus'
+        indexes = [
+            models.Index(fields=['restaurant_id', 'id'], name='menus_live_rest_idx', condition=models.Q(deleted_at__isnull=True)),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Category(TimestampedModel):
+class Category(SearchableModel, TimestampedModel):
     restaurant_id = models.CharField(max_length=50, db_index=True, db_column='restaurantId')
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
@@ -33,6 +67,9 @@ class Category(TimestampedModel):
 
     class Meta:
         db_table = 'categories'
+        indexes = [
+            models.Index(fields=['restaurant_id', 'id'], name='categories_live_rest_idx', condition=models.Q(deleted_at__isnull=True)),
+        ]
 
     def __str__(self):
         return self.name
@@ -51,7 +88,7 @@ class CategoryMenu(models.Model):
         return f"{self.menu} - {self.name}"
 
 
-class Product(TimestampedModel):
+class Product(SearchableModel, TimestampedModel):
     name = models.CharField(max_length=255)
     restaurant_id = models.CharField(max_length=50, db_index=True, db_column='restaurantId')
     description = models.TextField(blank=True, null=True)
@@ -60,9 +97,14 @@ class Product(TimestampedModel):
     category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True, blank=True, db_column='categoryId', related_name='primary_products')
     available = models.BooleanField(default=True)
     categories = models.ManyToManyField('Category', through='ProductCategory', related_name='products', blank=True)
+    # timestamp of the last stock event applied; older or replayed events are dropped
+    stock_event_at = models.DateTimeField(null=True, blank=True, editable=False, db_column='stockEventAt')
 
     class Meta:
         db_table = 'products'
+        indexes = [
+            models.Index(fields=['restaurant_id', 'id'], name='products_live_rest_idx', condition=models.Q(deleted_at__isnull=True)),
+        ]
 
     def __str__(self):
         return self.name
@@ -92,3 +134,75 @@ class ProductCategoryMenu(models.Model):
 
     def __str__(self):
         return f"{self.product} in {self.category} (menu)"
+
+
+class EventJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder that falls back to ``str()`` like the broker payloads always did."""
+
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+class OutboxEvent(models.Model):
+    """Catalogue events written in the same transaction as the change, relayed to RabbitMQ later."""
+    routing_key = models.CharField(max_length=255, db_column='routingKey')
+    payload = models.JSONField(encoder=EventJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_column='createdAt')
+
+    class Meta:
+        db_table = 'outbox_events'
+
+    def __str__(self):
+        return f"{self.routing_key} #{self.id}"
+
+
+# Last-Modified of a restaurant no write has been recorded for
+NEVER_WRITTEN = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class RestaurantVersionManager(models.Manager):
+    def bump(self, restaurant_ids):
+        """Increment the version of every restaurant in ``restaurant_ids``."""
+        now = timezone.now()
+        for rid in {str(r) for r in restaurant_ids if r is not None}:
+            if self.filter(restaurant_id=rid).update(version=F('version') + 1, updated_at=now):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(restaurant_id=rid, version=1, updated_at=now)
+            except IntegrityError:
+                self.filter(restaurant_id=rid).update(version=F('version') + 1, updated_at=now)
+
+    def current(self, restaurant_id):
+        """The restaurant's version row, or an unsaved version 0 if it has none.
+
+        Reads never write: the row is created by the first ``bump``, and
+        migration 0009 seeded one for every restaurant that already had data.
+        """
+        rid = str(restaurant_id)
+        version = self.filter(restaurant_id=rid).first()
+        if version is None:
+            version = self.model(restaurant_id=rid, version=0, updated_at=NEVER_WRITTEN)
+        return version
+
+
+class RestaurantVersion(models.Model):
+    """Per-restaurant change counter, the HTTP validator for restaurant-scoped reads."""
+    restaurant_id = models.CharField(max_length=50, primary_key=True, db_column='restaurantId')
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(db_column='updatedAt')
+
+    objects = RestaurantVersionManager()
+
+    class Meta:
+        db_table = 'restaurant_versions'
+
+    def __str__(self):
+        return f"{self.restaurant_id} v{self.version}"
+
+    @property
+    def etag(self):
+        return f'W/"{self.restaurant_id}.{self.version}"'
@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+from .filters import SEARCH_ORDERING
+
+
+class CatalogueCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key, ``CATALOGUE_PAGE_SIZE`` rows per page by default.
+
+    Restaurant lists filter on ``restaurant_id`` equality, so ordering by ``id``
+    alone walks the ``(restaurant_id, id)`` index; unfiltered lists walk the
+    primary key. Either way page N costs the same as page 1. ``id`` is unique,
+    so it is a complete cursor on its own.
+
+    Ranked search results keep their relevance order: the cursor is then the
+    last row's ``search_rank``, and rows tied on it are skipped by offset.
+    """
+    ordering = 'id'
+    page_size = getattr(settings, 'CATALOGUE_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'CATALOGUE_MAX_PAGE_SIZE', 500)
+
+
+    def get_ordering(self, request, queryset, view):
+        if SEARCH_ORDERING[0].lstrip('-') in queryset.query.annotations:
+            return SEARCH_ORDERING
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import urlencode
+from redis.exceptions import RedisError
+
+from core.redis import get_redis, mark_redis_down, redis_available
+
+logger = logging.getLogger(__name__)
+
+VERSION_PREFIX = 'catalogue:ver:'
+RESPONSE_PREFIX = 'catalogue:resp:'
+LOCK_PREFIX = 'catalogue:lock:'
+GLOBAL_SCOPE = 'global'
+
+
+def restaurant_scope(restaurant_id):
+    return f'r:{restaurant_id}'
+
+
+def menu_scope(menu_id):
+    return f'm:{menu_id}'
+
+
+class ResponseCache:
+    """Serialized GET responses in Redis, keyed by scope version + path + query.
+
+    A scope is a restaurant, a menu or ``global``. Writes ``INCR`` the scope's
+    version key, which orphans every cached response of that scope at once, so
+    invalidation never scans keys. A miss takes a short ``SET NX`` lock so only
+    one worker rebuilds a hot entry while the others wait for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'errors': 0, 'waits': 0}
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'CATALOGUE_RESPONSE_CACHE_TTL', 0)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and redis_available()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _failed(self, exc):
+        self._count('errors')
+        mark_redis_down()
+        logger.warning("Response cache unavailable: %s", exc)
+
+    def _version(self, client, scope):
+        key = VERSION_PREFIX + scope
+        version = client.get(key)
+        if version is None:
+            # a fresh (or evicted) version key must never collide with older entries
+            client.set(key, int(time.time() * 1000), nx=True)
+            version = client.get(key)
+        return version.decode() if isinstance(version, bytes) else str(version)
+
+    def key(self, client, scope, request):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        digest = hashlib.sha1(f"{request.path}?{query}".encode()).hexdigest()
+        return f"{RESPONSE_PREFIX}{scope}:{self._version(client, scope)}:{digest}"
+
+    def fetch(self, scope, request, build):
+        """Return cached data for ``request`` or ``build()`` it.
+
+        ``build`` returns ``(data, cacheable)``; only cacheable data is stored.
+        """
+        if not self.enabled:
+            return build()[0]
+        try:
+            client = get_redis()
+            key = self.key(client, scope, request)
+            cached = client.get(key)
+            if cached is not None:
+                self._count('hits')
+                return json.loads(cached)
+            self._count('misses')
+            lock_key = LOCK_PREFIX + key
+            lock_ms = getattr(settings, 'CATALOGUE_RESPONSE_CACHE_LOCK_MS', 2000)
+            if not client.set(lock_key, b'1', nx=True, px=lock_ms):
+                cached = self._wait(client, key, lock_ms)
+                if cached is not None:
+                    return json.loads(cached)
+                lock_key = None
+        except RedisError as exc:
+            self._failed(exc)
+            return build()[0]
+
+        try:
+            data, cacheable = build()
+            if cacheable:
+                try:
+                    client.set(key, json.dumps(data, cls=DjangoJSONEncoder), ex=self.ttl)
+                except RedisError as exc:
+                    self._failed(exc)
+            return data
+        finally:
+            if lock_key is not None:
+                try:
+                    client.delete(lock_key)
+                except RedisError:
+                    pass
+
+    def _wait(self, client, key, lock_ms):
+        self._count('waits')
+        deadline = time.monotonic() + lock_ms / 1000
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            cached = client.get(key)
+            if cached is not None:
+                return cached
+        return None
+
+    def invalidate(self, scopes):
+        """Bump the version of every scope in ``scopes``."""
+        scopes = set(scopes)
+        if not scopes or not self.enabled:
+            return
+        try:
+            seed = int(time.time() * 1000)
+            pipe = get_redis().pipeline(transaction=False)
+            for scope in scopes:
+                pipe.set(VERSION_PREFIX + scope, seed, nx=True)
+                pipe.incr(VERSION_PREFIX + scope)
+            pipe.execute()
+        except RedisError as exc:
+            self._failed(exc)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+response_cache = ResponseCache()
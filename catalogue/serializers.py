@@ -1,20 +1,187 @@
-from rest_framework import serializers
+import copy
+import decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import ISO_8601, relations, serializers
+from rest_framework.settings import api_settings
+
+from core.timing import TimedSerializerMixin, timed
 from .models import Product, Category, Menu, ProductCategory, CategoryMenu, ProductCategoryMenu
+from .event_schemas import event_payload
+from .signals import event_batch, record, touch
+
+
+def _identity(value):
+    return value
+
+
+def _iso_datetime(value):
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _decimal(field):
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+
+    def convert(value):
+        return f'{value.quantize(quantum, rounding=field.rounding, context=context):f}'
+
+    return convert
+
+
+class ValuesRepresentation:
+    """The read output of a ``ModelSerializer``, built straight from ``.values()`` rows.
+
+    The readable fields, their columns and one converter per field are worked
+    out once per serializer class; rows then become dicts without DRF's
+    per-field ``get_attribute``/``to_representation`` calls or model
+    instances. Many-to-many primary keys come from one query per batch, on the
+    related model's default manager like the prefetch they replace.
+
+    Only fields whose output is reproduced exactly are supported (plain
+    columns, ISO 8601 datetimes, decimals as strings, primary-key relations);
+    ``of()`` returns ``None`` for any other serializer so callers fall back to it.
+    """
+    _cache = {}
+
+    def __init__(self, serializer_class):
+        self.model = serializer_class.Meta.model
+        self.fields = []  # (key, column, converter)
+        self.many_to_many = []  # (key, model field)
+        for field in serializer_class().fields.values():
+            if field.write_only:
+                continue
+            model_field = self.model._meta.get_field(field.source)
+            if isinstance(field, relations.ManyRelatedField):
+                if not (isinstance(field.child_relation, relations.PrimaryKeyRelatedField)
+                        and field.child_relation.pk_field is None and model_field.many_to_many):
+                    raise TypeError(field.field_name)
+                self.many_to_many.append((field.field_name, model_field))
+                self.fields.append((field.field_name, None, None))
+                continue
+            self.fields.append((field.field_name, model_field.attname, self._converter(field, model_field)))
+        self.pk = self.model._meta.pk.attname
+        self.columns = list(dict.fromkeys([self.pk, *(column for _, column, _ in self.fields if column)]))
+
+    @staticmethod
+    def _converter(field, model_field):
+        if isinstance(field, relations.PrimaryKeyRelatedField):
+            if field.pk_field is not None or not model_field.many_to_one:
+                raise TypeError(field.field_name)
+            return _identity
+        if isinstance(field, serializers.DateTimeField):
+            if getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601 or hasattr(field, 'timezone'):
+                raise TypeError(field.field_name)
+            return _iso_datetime
+        if isinstance(field, serializers.DecimalField):
+            coerce = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            if not coerce or field.localize or field.normalize_output or field.decimal_places is None:
+                raise TypeError(field.field_name)
+            return _decimal(field)
+        if isinstance(field, serializers.BigIntegerField):
+            if getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING):
+                return str
+            return _identity
+        # the database already returns what these fields output
+        if type(field) in (serializers.IntegerField, serializers.BooleanField, serializers.CharField,
+                           serializers.URLField, serializers.ReadOnlyField):
+            return _identity
+        raise TypeError(field.field_name)
+
+    @classmethod
+    def of(cls, serializer_class):
+        """The representation of ``serializer_class``, or ``None`` if it needs the serializer."""
+        # datetimes are rendered as the database returns them: in UTC
+        if settings.USE_TZ and timezone.get_current_timezone_name() != 'UTC':
+            return None
+        try:
+            return cls._cache[serializer_class]
+        except KeyError:
+            pass
+        try:
+            representation = cls(serializer_class)
+        except (TypeError, FieldDoesNotExist):
+            representation = None
+        cls._cache[serializer_class] = representation
+        return representation
 
+    def narrow(self, names):
+        """This representation restricted to the output fields in ``names``; the primary key is still read."""
+        narrowed = copy.copy(self)
+        narrowed.fields = [field for field in self.fields if field[0] in names]
+        narrowed.many_to_many = [field for field in self.many_to_many if field[0] in names]
+        narrowed.columns = list(dict.fromkeys([self.pk, *(column for _, column, _ in narrowed.fields if column)]))
+        return narrowed
 
-class CategorySerializer(serializers.ModelSerializer):
+    def rows(self, queryset):
+        """``queryset`` as the ``.values()`` rows ``many``/``one`` take.
+
+        Annotations the queryset is ordered by (a search rank) stay in the rows,
+        where a keyset paginator reads its cursor.
+        """
+        ordered_by = {str(name).lstrip('-') for name in queryset.query.order_by}
+        annotations = [name for name in queryset.query.annotations if name in ordered_by]
+        return queryset.prefetch_related(None).values(*self.columns, *annotations)
+
+    def many(self, rows):
+        rows = list(rows)
+        with timed('serialize', exclusive=True, calls=len(rows)):
+            related = {key: self._related_ids(field, rows) for key, field in self.many_to_many}
+            data = []
+            for row in rows:
+                item = {}
+                for key, column, convert in self.fields:
+                    if column is None:
+                        item[key] = related[key].get(row[self.pk], [])
+                        continue
+                    value = row[column]
+                    item[key] = None if value is None else convert(value)
+                data.append(item)
+        return data
+
+    def one(self, row):
+        return self.many([row])[0]
+
+    def _related_ids(self, field, rows):
+        if not rows:
+            return {}
+        query_name = field.related_query_name()
+        links = field.related_model._default_manager.filter(
+            **{f'{query_name}__in': [row[self.pk] for row in rows]}
+        ).values_list(query_name, 'pk')
+        grouped = {}
+        for pk, related_pk in links:
+            grouped.setdefault(pk, []).append(related_pk)
+        return grouped
+
+
+def represent_many(serializer_class, queryset):
+    """``serializer_class(queryset, many=True).data``, through ``ValuesRepresentation`` when it applies."""
+    representation = ValuesRepresentation.of(serializer_class)
+    if representation is None:
+        return serializer_class(queryset, many=True).data
+    return representation.many(representation.rows(queryset))
+
+
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'restaurant_id', 'name', 'description', 'image_url', 'created_at', 'updated_at', 'deleted_at')
 
 
-class MenuSerializer(serializers.ModelSerializer):
+class MenuSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Menu
         fields = ('id', 'name', 'description', 'image_url', 'price', 'restaurant_id', 'created_at', 'updated_at', 'deleted_at')
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # categories displayed as list of PKs and writable
     categories = serializers.PrimaryKeyRelatedField(many=True, queryset=Category.objects.all(), required=False)
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), allow_null=True, required=False)
@@ -27,34 +194,231 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         categories = validated_data.pop('categories', [])
-        product = Product.objects.create(**validated_data)
-        if categories:
-            product.categories.set(categories)
+        # the save and the categories change go out as one product event
+        with transaction.atomic(), event_batch():
+            product = Product.objects.create(**validated_data)
+            if categories:
+                product.categories.set(categories)
         return product
 
     def update(self, instance, validated_data):
         categories = validated_data.pop('categories', None)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        if categories is not None:
-            instance.categories.set(categories)
+        with transaction.atomic(), event_batch():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            if categories is not None:
+                instance.categories.set(categories)
         return instance
 
 
-class ProductCategorySerializer(serializers.ModelSerializer):
+class ProductCategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductCategory
         fields = ('id', 'category', 'product')
 
 
-class CategoryMenuSerializer(serializers.ModelSerializer):
+class CategoryMenuSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CategoryMenu
         fields = ('id', 'menu', 'name', 'quantity')
 
 
-class ProductCategoryMenuSerializer(serializers.ModelSerializer):
+class ProductCategoryMenuSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductCategoryMenu
-        fields = ('id', 'category', 'product')
\ No newline at end of file
+        fields = ('id', 'category', 'product')
+
+class BulkListSerializer(serializers.ListSerializer):
+    """Validates a whole payload, then writes it with ``bulk_create`` / ``bulk_update``.
+
+    Relations on bulk children are plain ids declared in ``Meta.bulk_relations``
+    and checked with one query per related model instead of one per row, and
+    ``Meta.bulk_unique`` is checked the same way. For updates, ``instance`` is
+    the queryset rows may be taken from and every item carries its ``id``.
+    Writes skip model signals, so each row is reported through ``record()``.
+    """
+
+    @property
+    def model(self):
+        return self.child.Meta.model
+
+    def _sources(self):
+        return {name: self.child.fields[name].source for name in self.child.Meta.bulk_relations}
+
+    @staticmethod
+    def _ids(value):
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def validate(self, attrs):
+        errors = [{} for _ in attrs]
+        if self.instance is not None:
+            ids = [item.get('id') for item in attrs]
+            self.rows = self.instance.in_bulk([pk for pk in ids if pk is not None])
+            seen = set()
+            for pk, error in zip(ids, errors):
+                if pk is None:
+                    error['id'] = ['This field is required.']
+                elif pk not in self.rows:
+                    error['id'] = [f'Invalid pk "{pk}" - object does not exist.']
+                elif pk in seen:
+                    error['id'] = ['Duplicate id in payload.']
+                seen.add(pk)
+
+        sources = self._sources()
+        found = {}
+        for related in set(self.child.Meta.bulk_relations.values()):
+            names = [name for name, model in self.child.Meta.bulk_relations.items() if model is related]
+            wanted = {pk for item in attrs for name in names for pk in self._ids(item.get(sources[name]))}
+            found[related] = set(related.objects.filter(id__in=wanted).values_list('id', flat=True)) if wanted else set()
+        for name, related in self.child.Meta.bulk_relations.items():
+            for item, error in zip(attrs, errors):
+                missing = [pk for pk in self._ids(item.get(sources[name])) if pk not in found[related]]
+                if missing:
+                    error[name] = [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]
+
+        unique = getattr(self.child.Meta, 'bulk_unique', None)
+        if unique and not any(errors):
+            self._validate_unique(attrs, errors, [sources.get(name, name) for name in unique])
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def _validate_unique(self, attrs, errors, fields):
+        def values(item):
+            row = self.rows.get(item.get('id')) if self.instance is not None else None
+            return tuple(item[f] if f in item else getattr(row, f, None) for f in fields)
+
+        keys = [values(item) for item in attrs]
+        lookup = {f'{f}__in': {key[i] for key in keys} for i, f in enumerate(fields)}
+        existing = {
+            row[:-1]: row[-1]
+            for row in self.model._default_manager.filter(**lookup).values_list(*fields, 'id')
+        }
+        seen = set()
+        for item, key, error in zip(attrs, keys, errors):
+            owner = existing.get(key)
+            if key in seen or (owner is not None and owner != item.get('id')):
+                error['non_field_errors'] = [f"The fields {', '.join(self.child.Meta.bulk_unique)} must make a unique set."]
+            seen.add(key)
+
+    def event_payload(self, obj):
+        return None
+
+    def create(self, validated_data):
+        objs = [self.model(**{k: v for k, v in item.items() if k != 'id'}) for item in validated_data]
+        objs = self.model._default_manager.bulk_create(objs)
+        for obj in objs:
+            record(obj, 'created', self.event_payload(obj))
+        return objs
+
+    def update(self, instance, validated_data):
+        objs, fields, moved_from = [], set(), set()
+        for item in validated_data:
+            obj = self.rows[item['id']]
+            if 'restaurant_id' in item and item['restaurant_id'] != obj.restaurant_id:
+                moved_from.add(obj.restaurant_id)
+            for attr, value in item.items():
+                if attr != 'id':
+                    setattr(obj, attr, value)
+                    fields.add(attr)
+            objs.append(obj)
+        if fields:
+            if any(f.name == 'updated_at' for f in self.model._meta.concrete_fields):
+                now = timezone.now()
+                for obj in objs:
+                    obj.updated_at = now
+                fields.add('updated_at')
+            self.model._default_manager.bulk_update(objs, sorted(fields))
+        if moved_from:
+            touch(moved_from)
+        for obj in objs:
+            record(obj, 'updated', self.event_payload(obj))
+        return objs
+
+
+class ProductBulkListSerializer(BulkListSerializer):
+    """Bulk products; ``categories`` is synced through ``ProductCategory`` in two statements."""
+
+    def create(self, validated_data):
+        categories = [item.pop('categories', []) for item in validated_data]
+        self._categories = {}
+        objs = self.model._default_manager.bulk_create(
+            [self.model(**{k: v for k, v in item.items() if k != 'id'}) for item in validated_data]
+        )
+        self._set_categories({obj.id: ids for obj, ids in zip(objs, categories)}, existing={})
+        for obj in objs:
+            record(obj, 'created', self.event_payload(obj))
+        return objs
+
+    def update(self, instance, validated_data):
+        categories = {item['id']: item.pop('categories') for item in validated_data if 'categories' in item}
+        existing = {}
+        for link_id, product_id, category_id in ProductCategory.objects.filter(
+            product_id__in=[item['id'] for item in validated_data]
+        ).values_list('id', 'product_id', 'category_id'):
+            existing.setdefault(product_id, {})[category_id] = link_id
+        self._categories = {pid: list(links) for pid, links in existing.items()}
+        self._set_categories(categories, existing)
+        return super().update(instance, validated_data)
+
+    def _set_categories(self, wanted, existing):
+        stale, links = [], []
+        for product_id, category_ids in wanted.items():
+            current = existing.get(product_id, {})
+            category_ids = list(dict.fromkeys(category_ids))
+            stale.extend(link_id for category_id, link_id in current.items() if category_id not in category_ids)
+            links.extend(
+                ProductCategory(product_id=product_id, category_id=category_id)
+                for category_id in category_ids if category_id not in current
+            )
+            self._categories[product_id] = category_ids
+        if stale:
+            ProductCategory.objects.filter(id__in=stale).delete()
+        for link in ProductCategory.objects.bulk_create(links):
+            record(link, 'created')
+
+    def event_payload(self, obj):
+        return event_payload(obj, categories=self._categories.get(obj.id, []))
+
+
+class ProductBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(source='category_id', allow_null=True, required=False)
+    categories = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'restaurant_id', 'description', 'image_url', 'price', 'category', 'categories', 'available')
+        list_serializer_class = ProductBulkListSerializer
+        bulk_relations = {'category': Category, 'categories': Category}
+
+
+class ProductCategoryBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(source='category_id')
+    product = serializers.IntegerField(source='product_id')
+
+    class Meta:
+        model = ProductCategory
+        fields = ('id', 'category', 'product')
+        list_serializer_class = BulkListSerializer
+        bulk_relations = {'category': Category, 'product': Product}
+        bulk_unique = ('category', 'product')
+        validators = []
+
+
+class ProductCategoryMenuBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(source='category_id')
+    product = serializers.IntegerField(source='product_id')
+
+    class Meta:
+        model = ProductCategoryMenu
+        fields = ('id', 'category', 'product')
+        list_serializer_class = BulkListSerializer
+        bulk_relations = {'category': CategoryMenu, 'product': Product}
+        bulk_unique = ('category', 'product')
+        validators = []
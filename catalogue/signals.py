@@ -1,14 +1,166 @@
-from django.db.models.signals import post_save, post_delete
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
-from django.forms.models import model_to_dict
 
-from .models import Product, Category, Menu, ProductCategory, CategoryMenu, ProductCategoryMenu
-from .events import publish_catalogue_event
+from .models import Product, Category, Menu, ProductCategory, CategoryMenu, ProductCategoryMenu, RestaurantVersion
+from .event_schemas import event_payload
+from .events import publish_catalogue_events
+from .response_cache import GLOBAL_SCOPE, menu_scope, response_cache, restaurant_scope
+
+_batch = ContextVar('catalogue_event_batch', default=None)
+
+
+class _Refs:
+    """Restaurants and menus touched by a set of writes, resolved with at most three queries."""
+
+    def __init__(self):
+        self.restaurant_ids = set()
+        self.menu_ids = set()
+        self.parent_menu_ids = set()
+        self.product_ids = set()
+        self.menu_category_ids = set()
+
+    def add(self, instance):
+        rid = getattr(instance, 'restaurant_id', None)
+        if rid is not None:
+            self.restaurant_ids.add(str(rid))
+        if isinstance(instance, Menu):
+            self.menu_ids.add(instance.id)
+        elif isinstance(instance, CategoryMenu):
+            self.parent_menu_ids.add(instance.menu_id)
+        elif isinstance(instance, ProductCategoryMenu):
+            self.menu_category_ids.add(instance.category_id)
+            self.product_ids.add(instance.product_id)
+        elif isinstance(instance, ProductCategory):
+            self.product_ids.add(instance.product_id)
+
+    def update(self, other):
+        self.restaurant_ids |= other.restaurant_ids
+        self.menu_ids |= other.menu_ids
+        self.parent_menu_ids |= other.parent_menu_ids
+        self.product_ids |= other.product_ids
+        self.menu_category_ids |= other.menu_category_ids
+
+    def resolve(self):
+        """Return ``(restaurant_ids, menu_ids)``."""
+        restaurant_ids = set(self.restaurant_ids)
+        parent_menu_ids = set(self.parent_menu_ids)
+        if self.menu_category_ids:
+            parent_menu_ids.update(
+                CategoryMenu.objects.filter(id__in=self.menu_category_ids).values_list('menu_id', flat=True)
+            )
+        if self.product_ids:
+            restaurant_ids.update(
+                Product.all_objects.filter(id__in=self.product_ids).values_list('restaurant_id', flat=True)
+            )
+        parent_menu_ids -= self.menu_ids
+        if parent_menu_ids:
+            restaurant_ids.update(
+                Menu.all_objects.filter(id__in=parent_menu_ids).values_list('restaurant_id', flat=True)
+            )
+        return restaurant_ids, self.menu_ids | parent_menu_ids
+
+
+def _merge(previous, action):
+    """Fold two actions on one entity into the action of its final state (``None``: nothing happened)."""
+    if previous == 'created':
+        return None if action == 'deleted' else 'created'
+    if previous == 'deleted' and action == 'created':
+        return 'updated'
+    return action
+
+
+class _EventBatch:
+    """Events of one unit of work, collapsed to one event per entity."""
+
+    def __init__(self):
+        self.events = {}
+        self.refs = _Refs()
+
+    def add(self, instance, action: str, payload=None):
+        self.refs.add(instance)
+        self.add_event(_event(instance, action, payload))
 
+    def add_event(self, event, refs=None):
+        resource, action, resource_id, payload = event
+        if refs is not None:
+            self.refs.update(refs)
+        key = (resource, resource_id)
+        previous = self.events.pop(key, None)
+        if previous is not None:
+            action = _merge(previous[1], action)
+            if action is None:
+                return
+        self.events[key] = (resource, action, resource_id, payload)
 
-def _publish(instance, action: str):
-    payload = model_to_dict(instance)
-    publish_catalogue_event(instance.__class__.__name__.lower(), action, getattr(instance, 'id', None), payload)
+    def emit(self):
+        publish_catalogue_events(list(self.events.values()))
+        touch(*self.refs.resolve())
+        self.events = {}
+        self.refs = _Refs()
+
+
+def _event(instance, action: str, payload=None):
+    if payload is None:
+        payload = event_payload(instance)
+    return (instance.__class__.__name__.lower(), action, getattr(instance, 'id', None), payload)
+
+
+def touch(restaurant_ids, menu_ids=()):
+    """Invalidate ETags and cached responses for the given restaurants and menus.
+
+    Also used by writers that bypass model signals (``QuerySet.update``, bulk writes).
+    The version bump is part of the caller's transaction, so the new ETag commits
+    with the write; only the cache invalidation waits for the commit.
+    """
+    restaurant_ids = {str(r) for r in restaurant_ids if r is not None}
+    RestaurantVersion.objects.bump(restaurant_ids)
+    scopes = {GLOBAL_SCOPE}
+    scopes.update(restaurant_scope(r) for r in restaurant_ids)
+    scopes.update(menu_scope(m) for m in menu_ids if m is not None)
+    transaction.on_commit(lambda: response_cache.invalidate(scopes))
+
+
+@contextmanager
+def event_batch():
+    """Collect the catalogue events of a bulk write and emit them once.
+
+    Inside the block, signal receivers and ``record()`` only buffer; on a clean
+    exit the events, one per entity, go to the outbox in one INSERT within the
+    caller's transaction, and caches are invalidated once for every restaurant
+    and menu involved. Nested blocks join the outer one. Open it inside the
+    transaction (``with transaction.atomic(), event_batch():``) so the events
+    and the version bump commit, or roll back, with the writes.
+    """
+    if _batch.get() is not None:
+        yield _batch.get()
+        return
+    batch = _EventBatch()
+    token = _batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _batch.reset(token)
+    batch.emit()
+
+
+def record(instance, action: str, payload=None):
+    """Emit the event for a write, or buffer it.
+
+    Inside ``event_batch()`` it joins the batch; otherwise the event goes to the
+    outbox right away, in the same transaction as the write. Writers that skip
+    model signals call this directly.
+    """
+    batch = _batch.get()
+    if batch is not None:
+        batch.add(instance, action, payload)
+        return
+    batch = _EventBatch()
+    batch.add(instance, action, payload)
+    batch.emit()
 
 
 @receiver(post_save, sender=Product)
@@ -18,8 +170,7 @@ def _publish(instance, action: str):
 @receiver(post_save, sender=CategoryMenu)
 @receiver(post_save, sender=ProductCategoryMenu)
 def on_save(sender, instance, created, **kwargs):
-    action = 'created' if created else 'updated'
-    _publish(instance, action)
+    record(instance, 'created' if created else 'updated')
 
 
 @receiver(post_delete, sender=Product)
@@ -29,4 +180,29 @@ def on_save(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=CategoryMenu)
 @receiver(post_delete, sender=ProductCategoryMenu)
 def on_delete(sender, instance, **kwargs):
-    _publish(instance, 'deleted')
+    record(instance, 'deleted')
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def on_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """``categories.add/remove/set/clear`` write the join table without model signals."""
+    if action == 'pre_clear' and reverse:
+        # the products losing this category are unknown once the rows are gone
+        instance._catalogue_cleared = set(
+            ProductCategory.objects.filter(category=instance).values_list('product_id', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        product_ids = set(pk_set or ())
+        if action == 'post_clear':
+            product_ids |= instance.__dict__.pop('_catalogue_cleared', set())
+        products = Product.all_objects.filter(id__in=product_ids)
+    else:
+        products = [instance]
+    categories = {}
+    for product_id, category_id in ProductCategory.objects.filter(product__in=products).values_list('product_id', 'category_id'):
+        categories.setdefault(product_id, []).append(category_id)
+    for product in products:
+        record(product, 'updated', event_payload(product, categories=categories.get(product.id, [])))
@@ -0,0 +1,113 @@
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from core.redis import get_redis, mark_redis_down, redis_available
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'catalogue:stock:'
+
+
+class AvailabilityCache:
+    """Per-product ``in_stock`` flags cached in Redis with a TTL.
+
+    Any Redis failure degrades to a cache miss so reads fall back to the Stock API.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'STOCK_AVAILABILITY_CACHE_TTL', 0)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and redis_available()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _failed(self, exc):
+        self._count('errors')
+        mark_redis_down()
+        logger.warning("Stock availability cache unavailable: %s", exc)
+
+    def get_many(self, ids):
+        """Return ``({str(id): bool}, [missing ids])`` with one MGET."""
+        keys = [str(i) for i in ids]
+        if not keys:
+            return {}, []
+        if not self.enabled:
+            return {}, keys
+        try:
+            values = get_redis().mget([KEY_PREFIX + k for k in keys])
+        except RedisError as exc:
+            self._failed(exc)
+            return {}, keys
+        found = {k: v == b'1' for k, v in zip(keys, values) if v is not None}
+        missing = [k for k in keys if k not in found]
+        self._count('hits', len(found))
+        self._count('misses', len(missing))
+        return found, missing
+
+    def set_many(self, mapping):
+        if not mapping or not self.enabled:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for pid, in_stock in mapping.items():
+                pipe.set(KEY_PREFIX + str(pid), b'1' if in_stock else b'0', ex=self.ttl)
+            pipe.execute()
+        except RedisError as exc:
+            self._failed(exc)
+
+    def invalidate(self, ids):
+        keys = [KEY_PREFIX + str(i) for i in ids]
+        if not keys or not self.enabled:
+            return
+        try:
+            get_redis().delete(*keys)
+        except RedisError as exc:
+            self._failed(exc)
+
+    def lookup(self, ids, fetch):
+        """Cached availability for ``ids``; only the misses are passed to ``fetch``.
+
+        ``fetch`` takes a list of string ids and returns ``{str(id): bool}``.
+        """
+        found, missing = self.get_many(ids)
+        if missing:
+            fetched = fetch(missing)
+            if fetched:
+                fetched = {str(k): bool(v) for k, v in fetched.items()}
+                self.set_many(fetched)
+                found.update(fetched)
+        return found
+
+    async def alookup(self, ids, fetch):
+        """``lookup`` for the event loop: ``fetch`` is awaited and Redis is called from a worker thread."""
+        if not self.enabled:
+            keys = [str(i) for i in ids]
+            return {str(k): bool(v) for k, v in (await fetch(keys)).items()} if keys else {}
+        found, missing = await sync_to_async(self.get_many, thread_sensitive=False)(ids)
+        if missing:
+            fetched = await fetch(missing)
+            if fetched:
+                fetched = {str(k): bool(v) for k, v in fetched.items()}
+                await sync_to_async(self.set_many, thread_sensitive=False)(fetched)
+                found.update(fetched)
+        return found
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+availability_cache = AvailabilityCache()
@@ -0,0 +1,286 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from core import metrics, timing
+
+logger = logging.getLogger(__name__)
+
+
+class StockUnavailable(Exception):
+    """The Stock API could not be reached, answered 5xx, or the circuit is open."""
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets a single
+    probe through once ``reset_timeout`` seconds have passed."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.reset()
+
+    def abandon(self):
+        """A call ended with neither outcome (cancelled, unexpected error).
+
+        A half-open probe counts as failed, so the next one is let through
+        after ``reset_timeout`` instead of the circuit staying half-open.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Stock API circuit opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class StockClient:
+    """Shared Stock API client with a keep-alive pool and a circuit breaker."""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'STOCK_API_BREAKER_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'STOCK_API_BREAKER_RESET', 30),
+        )
+        self._pid = None
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def base(self):
+        return getattr(settings, 'STOCK_API_BASE', '').rstrip('/')
+
+    def _resources(self):
+        # sessions and thread pools must not be shared across fork()
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    pool_size = getattr(settings, 'STOCK_API_POOL_SIZE', 20)
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, 'STOCK_API_MAX_WORKERS', 4),
+                        thread_name_prefix='stock-api',
+                    )
+                    self._pid = os.getpid()
+        return self._session, self._executor
+
+    def _allow(self):
+        if not self.base:
+            raise StockUnavailable('STOCK_API_BASE is not configured')
+        if not self.breaker.allow():
+            timing.count('stock', 'open')
+            metrics.STOCK_API_ERRORS.labels('circuit_open').inc()
+            raise StockUnavailable('circuit open')
+
+    def _failed(self, reason, message):
+        metrics.STOCK_API_ERRORS.labels(reason).inc()
+        timing.count('stock', 'error')
+        self.breaker.record_failure()
+        return StockUnavailable(message)
+
+    def _answered(self, resp):
+        if resp.status_code >= 500:
+            raise self._failed('server_error', f"Stock API returned {resp.status_code}")
+        timing.count('stock', 'ok')
+        self.breaker.record_success()
+        return resp
+
+    def get(self, path, params=None, timeout=None):
+        """GET ``path`` below STOCK_API_BASE.
+
+        Raises ``StockUnavailable`` on connection errors, 5xx answers or while
+        the circuit is open. Other statuses are returned to the caller.
+        """
+        self._allow()
+        session, _ = self._resources()
+        started = time.perf_counter()
+        try:
+            resp = session.get(
+                f"{self.base}/{path.lstrip('/')}",
+                params=params,
+                timeout=timeout or getattr(settings, 'STOCK_API_TIMEOUT', 2),
+            )
+        except requests.RequestException as exc:
+            metrics.STOCK_API_SECONDS.observe(time.perf_counter() - started)
+            raise self._failed('connection', str(exc)) from exc
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        metrics.STOCK_API_SECONDS.observe(time.perf_counter() - started)
+        return self._answered(resp)
+
+    def availability(self, product_id):
+        """``True``/``False`` for one product, ``None`` when unknown."""
+        try:
+            with timing.timed('stock'):
+                resp = self.get(f"products/{product_id}/availability/")
+            if resp.status_code == 200:
+                return bool(resp.json().get('available'))
+        except (StockUnavailable, ValueError, AttributeError):
+            pass
+        return None
+
+    def _availability_chunk(self, ids):
+        try:
+            resp = self.get('products/availability/', params={'ids': ','.join(ids)})
+            if resp.status_code == 200:
+                payload = resp.json()
+                if isinstance(payload, dict):
+                    # an answered chunk covers all of its ids; unlisted ones are out of stock
+                    return {i: bool(payload.get(i)) for i in ids}
+        except (StockUnavailable, ValueError) as exc:
+            logger.info("Stock availability lookup failed for %s ids: %s", len(ids), exc)
+        return {}
+
+    def availability_many(self, ids):
+        """``{str(id): bool}`` for ``ids``; chunks run in parallel.
+
+        The ids of a failed chunk are left out, so callers report them as
+        unknown (``None``) rather than out of stock.
+        """
+        ids = [str(i) for i in ids]
+        if not ids:
+            return {}
+        size = getattr(settings, 'STOCK_API_CHUNK_SIZE', 100)
+        chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+        merged = {}
+        with timing.timed('stock'):
+            if len(chunks) == 1:
+                results = [self._availability_chunk(chunks[0])]
+            else:
+                _, executor = self._resources()
+                # each chunk runs in a copy of the request's context so its outcome is counted
+                results = [
+                    executor.submit(contextvars.copy_context().run, self._availability_chunk, chunk)
+                    for chunk in chunks
+                ]
+                results = [future.result() for future in results]
+            for partial in results:
+                merged.update({str(k): bool(v) for k, v in partial.items()})
+        return merged
+
+
+class AsyncStockClient(StockClient):
+    """``StockClient`` for the ASGI read path, sharing the sync client's breaker.
+
+    Calls go through one pooled ``httpx.AsyncClient`` per event loop, and the
+    chunks of ``availability_many`` are gathered on the loop instead of
+    occupying threads while the Stock API answers.
+    """
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            pool_size = getattr(settings, 'STOCK_API_POOL_SIZE', 20)
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+            self._clients[loop] = client
+        return client
+
+    async def get(self, path, params=None, timeout=None):
+        self._allow()
+        started = time.perf_counter()
+        try:
+            resp = await self._client().get(
+                f"{self.base}/{path.lstrip('/')}",
+                params=params,
+                timeout=timeout or getattr(settings, 'STOCK_API_TIMEOUT', 2),
+            )
+        except httpx.HTTPError as exc:
+            metrics.STOCK_API_SECONDS.observe(time.perf_counter() - started)
+            raise self._failed('connection', str(exc)) from exc
+        except BaseException:
+            # includes CancelledError when the client goes away mid-read
+            self.breaker.abandon()
+            raise
+        metrics.STOCK_API_SECONDS.observe(time.perf_counter() - started)
+        return self._answered(resp)
+
+    async def availability(self, product_id):
+        try:
+            with timing.timed('stock'):
+                resp = await self.get(f"products/{product_id}/availability/")
+            if resp.status_code == 200:
+                return bool(resp.json().get('available'))
+        except (StockUnavailable, ValueError, AttributeError):
+            pass
+        return None
+
+    async def _availability_chunk(self, ids):
+        try:
+            resp = await self.get('products/availability/', params={'ids': ','.join(ids)})
+            if resp.status_code == 200:
+                payload = resp.json()
+                if isinstance(payload, dict):
+                    # an answered chunk covers all of its ids; unlisted ones are out of stock
+                    return {i: bool(payload.get(i)) for i in ids}
+        except (StockUnavailable, ValueError) as exc:
+            logger.info("Stock availability lookup failed for %s ids: %s", len(ids), exc)
+        return {}
+
+    async def availability_many(self, ids):
+        ids = [str(i) for i in ids]
+        if not ids:
+            return {}
+        size = getattr(settings, 'STOCK_API_CHUNK_SIZE', 100)
+        merged = {}
+        with timing.timed('stock'):
+            results = await asyncio.gather(*(
+                self._availability_chunk(ids[i:i + size]) for i in range(0, len(ids), size)
+            ))
+            for partial in results:
+                merged.update({str(k): bool(v) for k, v in partial.items()})
+        return merged
+
+
+stock_client = StockClient()
+async_stock_client = AsyncStockClient(stock_client.breaker)
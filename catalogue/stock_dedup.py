@@ -0,0 +1,74 @@
+import logging
+import threading
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from core.redis import get_redis, mark_redis_down, redis_available
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'catalogue:stock-event:'
+
+
+class RecentStockEvents:
+    """Ids of recently applied stock events, kept in Redis for ``STOCK_EVENT_DEDUP_TTL`` seconds.
+
+    Ids are checked before a batch is applied and marked only after it
+    committed, so a crash mid-batch never hides the redelivery. Redis failures
+    disable the window; per-product versions still drop stale events.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {'duplicates': 0, 'errors': 0}
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'STOCK_EVENT_DEDUP_TTL', 0)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and redis_available()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _failed(self, exc):
+        self._count('errors')
+        mark_redis_down()
+        logger.warning("Stock event dedup window unavailable: %s", exc)
+
+    def seen(self, ids):
+        """The subset of ``ids`` already applied, with one MGET."""
+        ids = list(ids)
+        if not ids or not self.enabled:
+            return set()
+        try:
+            values = get_redis().mget([KEY_PREFIX + i for i in ids])
+        except RedisError as exc:
+            self._failed(exc)
+            return set()
+        seen = {i for i, v in zip(ids, values) if v is not None}
+        self._count('duplicates', len(seen))
+        return seen
+
+    def mark(self, ids):
+        ids = list(ids)
+        if not ids or not self.enabled:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for i in ids:
+                pipe.set(KEY_PREFIX + i, b'1', ex=self.ttl)
+            pipe.execute()
+        except RedisError as exc:
+            self._failed(exc)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+recent_stock_events = RecentStockEvents()
@@ -0,0 +1,240 @@
+import decimal
+import logging
+import queue
+import threading
+import time
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import event_codec, metrics
+
+from .models import Product
+from .signals import event_batch, record, touch
+from .stock_cache import availability_cache
+from .stock_client import stock_client
+from .stock_dedup import recent_stock_events
+
+logger = logging.getLogger(__name__)
+
+# columns a stock event may change; everything else on a product is catalogue-owned.
+# ``stock_event_at`` is only written by events that carry a timestamp.
+STOCK_EVENT_FIELDS = ["name", "restaurant_id", "available", "deleted_at", "updated_at"]
+
+
+def parse_stock_event(body, message_id=None, content_type=None):
+    """Decode a stock event, or return ``None`` for bodies that are not objects.
+
+    The producer's ``eventId``, else the AMQP ``message_id``, is kept as the
+    event's ``eventId`` for deduplication. Events with neither are never
+    deduplicated: two genuine events may carry the same bytes.
+    """
+    try:
+        event = event_codec.decode(body, content_type)
+    except (TypeError, ValueError):
+        logger.warning("Dropping undecodable stock event")
+        return None
+    if not isinstance(event, dict):
+        return None
+    if not event.get("eventId") and message_id:
+        event["eventId"] = message_id
+    return event
+
+
+def event_time(event):
+    """The producer timestamp of ``event`` as an aware datetime, if it carries one."""
+    value = event.get("timestamp")
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _latest_per_product(events):
+    """Keep the newest product event per id: highest timestamp, then last delivered."""
+    latest = {}
+    for event in events:
+        product_id = product_key(event)
+        if product_id is None:
+            continue
+        payload = event.get("payload") or {}
+        action = event.get("action")
+        if action in ("created", "updated"):
+            if payload.get("name") is None or payload.get("restaurantId") is None:
+                continue
+        elif action != "deleted":
+            continue
+        at = event_time(event)
+        current = latest.get(product_id)
+        if current is not None and at is not None and current[2] is not None and at < current[2]:
+            continue
+        latest[product_id] = (action, payload, at)
+    return latest
+
+
+def _drop_stale(latest, applied_at):
+    """Remove events not newer than the last one applied to their product."""
+    for pid, (_, _, at) in list(latest.items()):
+        if at is not None and applied_at.get(pid) is not None and at <= applied_at[pid]:
+            del latest[pid]
+
+
+def apply_stock_events(events):
+    """Apply a batch of decoded stock events with set-based writes.
+
+    Events already applied (by ``eventId``, see ``recent_stock_events``) or
+    older than the product's ``stock_event_at`` are dropped before any write.
+    Availability for every remaining upsert comes from one batched Stock API
+    lookup, upserts are one ``INSERT ... ON CONFLICT`` and deletes one
+    ``UPDATE`` (two of each when some events carry no timestamp), all in one
+    transaction and one catalogue event batch.
+    Returns the number of products written.
+    """
+    event_ids = list(dict.fromkeys(e["eventId"] for e in events if e.get("eventId")))
+    seen = recent_stock_events.seen(event_ids)
+    events = [e for e in events if e.get("eventId") not in seen]
+    latest = _latest_per_product(events)
+    if latest:
+        _drop_stale(latest, dict(Product.all_objects.filter(id__in=latest).values_list("id", "stock_event_at")))
+    if not latest:
+        recent_stock_events.mark(event_ids)
+        return 0
+    upsert_ids = [pid for pid, (action, _, _) in latest.items() if action != "deleted"]
+    availability = stock_client.availability_many(upsert_ids) if upsert_ids else {}
+
+    now = timezone.now()
+    with transaction.atomic(), event_batch():
+        # re-check under row locks: another consumer may have applied newer events meanwhile
+        previous = {
+            pid: (rid, at)
+            for pid, rid, at in Product.all_objects.select_for_update()
+            .filter(id__in=latest).values_list("id", "restaurant_id", "stock_event_at")
+        }
+        _drop_stale(latest, {pid: at for pid, (_, at) in previous.items()})
+        upserts = [
+            Product(
+                id=pid,
+                name=payload["name"],
+                restaurant_id=str(payload["restaurantId"]),
+                description=None,
+                image_url=None,
+                price=decimal.Decimal("0.00"),
+                available=availability.get(str(pid), True),
+                category=None,
+                deleted_at=None,
+                stock_event_at=at,
+            )
+            for pid, (action, payload, at) in latest.items() if action != "deleted"
+        ]
+        deletes = [
+            Product(id=pid, deleted_at=now, updated_at=now, stock_event_at=at)
+            for pid, (action, _, at) in latest.items() if action == "deleted" and pid in previous
+        ]
+        # an event without a timestamp keeps the product's watermark
+        for stamped, extra in ((True, ["stock_event_at"]), (False, [])):
+            rows = [p for p in upserts if (p.stock_event_at is not None) is stamped]
+            if rows:
+                Product.all_objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=STOCK_EVENT_FIELDS + extra,
+                )
+            rows = [p for p in deletes if (p.stock_event_at is not None) is stamped]
+            if rows:
+                Product.all_objects.bulk_update(rows, ["deleted_at", "updated_at"] + extra)
+        # restaurants a product moved away from are not visible on the rows any more
+        touch({rid for rid, _ in previous.values()})
+        for product in Product.all_objects.filter(id__in=latest).prefetch_related("categories"):
+            action = latest[product.id][0]
+            if action != "deleted":
+                action = "updated" if product.id in previous else "created"
+            record(product, action)
+
+    # refresh the read-side cache with what the Stock API just told us
+    availability_cache.set_many({pid: available for pid, available in availability.items()})
+    availability_cache.invalidate([p.id for p in upserts if str(p.id) not in availability] + [p.id for p in deletes])
+    recent_stock_events.mark(event_ids)
+    return len(upserts) + len(deletes)
+
+
+def product_key(event):
+    """The product id that orders ``event``, or ``None`` if it is not a product event."""
+    if not event or event.get("resource") != "products":
+        return None
+    payload = event.get("payload") or {}
+    try:
+        return int(event.get("id") or payload.get("id"))
+    except (TypeError, ValueError):
+        return None
+
+
+class KeyedDispatcher:
+    """Applies stock events on ``workers`` threads, sharded by product id.
+
+    All events for one product go to the same worker and are applied in
+    delivery order, while different products proceed in parallel. Each worker
+    drains up to ``batch_size`` events (waiting at most ``batch_wait`` seconds)
+    into one ``apply_stock_events`` call, then reports the delivery tags to
+    ``on_done(tags, events, written)``. The first failure stops every worker and is kept
+    in ``error`` for the consumer to re-raise.
+    """
+
+    def __init__(self, workers, on_done, batch_size=1, batch_wait=0.2):
+        self.on_done = on_done
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.error = None
+        self._stopping = threading.Event()
+        self._queues = [queue.Queue() for _ in range(max(1, workers))]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"stock-events-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, tag, event):
+        self._queues[hash(key) % len(self._queues)].put((tag, event))
+
+    def _run(self, items):
+        try:
+            while not self._stopping.is_set():
+                try:
+                    batch = [items.get(timeout=self.batch_wait)]
+                except queue.Empty:
+                    continue
+                deadline = time.monotonic() + self.batch_wait
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(items.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                events = [event for _, event in batch]
+                try:
+                    written = apply_stock_events(events)
+                except Exception:
+                    metrics.STOCK_EVENTS_FAILED.inc(len(events))
+                    raise
+                self.on_done([tag for tag, _ in batch], events, written)
+        except Exception as exc:
+            logger.exception("Stock event worker failed")
+            self.error = exc
+            self._stopping.set()
+        finally:
+            connection.close()
+
+    def close(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,97 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StockStub:
+    """Local stand-in for the Stock API, for benchmarks.
+
+    Serves the availability routes ``StockClient`` calls on an ephemeral port,
+    after ``latency_ms`` (+/- ``jitter_ms``) and failing ``failure_rate`` of the
+    calls with a 503. Availability is a stable function of the product id, so
+    runs with the same ``seed`` see the same stock.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, unavailable_ratio=0.05, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.unavailable_ratio = unavailable_ratio
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'failures': 0}
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def available(self, product_id):
+        return random.Random(f"{self.seed}:{product_id}").random() >= self.unavailable_ratio
+
+    def _draw(self):
+        """``(delay seconds, fail)`` for one call, from the shared seeded generator."""
+        with self._lock:
+            self._counters['requests'] += 1
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self._counters['failures'] += 1
+        return delay, fail
+
+    def answer(self, path, query):
+        """``(status, payload)`` for a GET of ``path``."""
+        delay, fail = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return 503, {'detail': 'stub failure'}
+        parts = [p for p in path.split('/') if p]
+        if parts[-2:] == ['products', 'availability']:
+            ids = [i for i in query.get('ids', [''])[0].split(',') if i]
+            return 200, {i: self.available(i) for i in ids}
+        if len(parts) >= 3 and parts[-1] == 'availability' and parts[-3] == 'products':
+            return 200, {'id': parts[-2], 'available': self.available(parts[-2])}
+        return 404, {'detail': 'not found'}
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, payload = stub.answer(url.path, parse_qs(url.query))
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stock-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
@@ -1,30 +1,65 @@
+import asyncio
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+import json
+import tempfile
+import threading
 from unittest.mock import Mock, patch
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import connections
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework import status
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
+import requests
+from prometheus_client import REGISTRY
+from pika.exceptions import AMQPConnectionError
+from redis.exceptions import ConnectionError as RedisConnectionError
 from rest_framework.test import APITestCase
 
+from core import event_codec
+from core.renderers import FastJSONRenderer
+from core.rabbitmq import EventPublisher
+
+from .async_views import AsyncProductReads, product_view
+from .events import publish_catalogue_events
+from .management.commands.consume_stock_events import AckTracker
+from .filters import SEARCH_ORDERING, CatalogueSearchFilter
 from .models import (
     Category,
     CategoryMenu,
     Menu,
+    OutboxEvent,
     Product,
     ProductCategory,
     ProductCategoryMenu,
+    RestaurantVersion,
 )
+from .pagination import CatalogueCursorPagination
+from .response_cache import response_cache
+from .serializers import CategorySerializer, MenuSerializer, ProductSerializer, ValuesRepresentation
+from .signals import event_batch, record
+from .stock_client import AsyncStockClient, CircuitBreaker, StockUnavailable, async_stock_client, stock_client
+from .stock_events import KeyedDispatcher, apply_stock_events, parse_stock_event
+from .stock_stub import StockStub
 
 
-@override_settings(STOCK_API_BASE="http://stock.test/api")
+@override_settings(STOCK_API_BASE="http://stock.test/api", STOCK_AVAILABILITY_CACHE_TTL=0, CATALOGUE_RESPONSE_CACHE_TTL=0)
 class CatalogueRoutesTests(APITestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        cls.publish_event_patcher = patch("catalogue.signals.publish_catalogue_event")
-        cls.publish_event_patcher.start()
+        cls.publish_event_patcher = patch("catalogue.signals.publish_catalogue_events")
+        cls.publish_events = cls.publish_event_patcher.start()
 
     @classmethod
     def tearDownClass(cls):
@@ -32,82 +67,85 @@ class CatalogueRoutesTests(APITestCase):
         super().tearDownClass()
 
     def setUp(self):
+        stock_client.breaker.reset()
         self.user = get_user_model().objects.create_user(
             username="tester",
             password="testpass123",
         )
 
-        self.category_r1 = Category.objects.create(
-            restaurant_id=1,
-            name="Burgers",
-            description="Cat r1",
-        )
-        self.category_r2 = Category.objects.create(
-            restaurant_id=2,
-            name="Desserts",
-            description="Cat r2",
-        )
+        # fixtures are committed writes: run their on_commit work (response cache invalidation)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category_r1 = Category.objects.create(
+                restaurant_id=1,
+                name="Burgers",
+                description="Cat r1",
+            )
+            self.category_r2 = Category.objects.create(
+                restaurant_id=2,
+                name="Desserts",
+                description="Cat r2",
+            )
 
-        self.menu_r1 = Menu.objects.create(
-            restaurant_id=1,
-            name="Midi",
-            description="Menu r1",
-            price="12.50",
-        )
-        self.menu_r2 = Menu.objects.create(
-            restaurant_id=2,
-            name="Soir",
-            description="Menu r2",
-            price="18.90",
-        )
+            self.menu_r1 = Menu.objects.create(
+                restaurant_id=1,
+                name="Midi",
+                description="Menu r1",
+                price="12.50",
+            )
+            self.menu_r2 = Menu.objects.create(
+                restaurant_id=2,
+                name="Soir",
+                description="Menu r2",
+                price="18.90",
+            )
 
-        self.product_r1 = Product.objects.create(
-            restaurant_id=1,
-            name="Cheeseburger",
-            description="Produit r1",
-            price="10.00",
-            category=self.category_r1,
-        )
-        self.product_r2 = Product.objects.create(
-            restaurant_id=2,
-            name="Tiramisu",
-            description="Produit r2",
-            price="6.00",
-            category=self.category_r2,
-        )
+            self.product_r1 = Product.objects.create(
+                restaurant_id=1,
+                name="Cheeseburger",
+                description="Produit r1",
+                price="10.00",
+                category=self.category_r1,
+            )
+            self.product_r2 = Product.objects.create(
+                restaurant_id=2,
+                name="Tiramisu",
+                description="Produit r2",
+                price="6.00",
+                category=self.category_r2,
+            )
 
-        self.menu_category_r1 = CategoryMenu.objects.create(
-            menu=self.menu_r1,
-            name="Plats",
-            quantity=1,
-        )
-        self.menu_category_r2 = CategoryMenu.objects.create(
-            menu=self.menu_r2,
-            name="Desserts",
-            quantity=1,
-        )
+            self.menu_category_r1 = CategoryMenu.objects.create(
+                menu=self.menu_r1,
+                name="Plats",
+                quantity=1,
+            )
+            self.menu_category_r2 = CategoryMenu.objects.create(
+                menu=self.menu_r2,
+                name="Desserts",
+                quantity=1,
+            )
 
-        ProductCategoryMenu.objects.create(
-            category=self.menu_category_r1,
-            product=self.product_r1,
-        )
-        ProductCategoryMenu.objects.create(
-            category=self.menu_category_r2,
-            product=self.product_r2,
-        )
-        ProductCategory.objects.create(
-            category=self.category_r1,
-            product=self.product_r1,
-        )
-        ProductCategory.objects.create(
-            category=self.category_r2,
-            product=self.product_r2,
-        )
+            ProductCategoryMenu.objects.create(
+                category=self.menu_category_r1,
+                product=self.product_r1,
+            )
+            ProductCategoryMenu.objects.create(
+                category=self.menu_category_r2,
+                product=self.product_r2,
+            )
+            ProductCategory.objects.create(
+                category=self.category_r1,
+                product=self.product_r1,
+            )
+            ProductCategory.objects.create(
+                category=self.category_r2,
+                product=self.product_r2,
+            )
 
     def authenticate(self):
         self.client.force_authenticate(user=self.user)
 
-    @patch("catalogue.views.requests.get")
+    @patch("catalogue.stock_client.requests.Session.get")
     def test_products_list_route_returns_stock_flags(self, mock_get):
         mock_get.return_value = Mock(
             status_code=200,
@@ -122,12 +160,27 @@ class CatalogueRoutesTests(APITestCase):
         response = self.client.get(reverse("product-list"))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
-        payload = {item["id"]: item for item in response.data}
+        self.assertEqual(len(response.data["results"]), 2)
+        payload = {item["id"]: item for item in response.data["results"]}
         self.assertTrue(payload[self.product_r1.id]["in_stock"])
         self.assertFalse(payload[self.product_r2.id]["in_stock"])
 
-    @patch("catalogue.views.requests.get")
+    @override_settings(STOCK_API_CHUNK_SIZE=1)
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_failed_stock_chunk_leaves_its_products_unknown(self, mock_get):
+        def answer(url, params=None, timeout=None):
+            if params["ids"] == str(self.product_r2.id):
+                return Mock(status_code=503)
+            return Mock(status_code=200, json=Mock(return_value={}))
+        mock_get.side_effect = answer
+
+        response = self.client.get(reverse("product-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        flags = {item["id"]: item["in_stock"] for item in response.data["results"]}
+        self.assertEqual(flags, {self.product_r1.id: False, self.product_r2.id: None})
+
+    @patch("catalogue.stock_client.requests.Session.get")
     def test_product_retrieve_route_returns_stock_flag(self, mock_get):
         mock_get.return_value = Mock(
             status_code=200,
@@ -151,8 +204,8 @@ class CatalogueRoutesTests(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["id"], self.product_r1.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["id"], self.product_r1.id)
 
     def test_categories_routes_filter_by_restaurant(self):
         response_query = self.client.get(f'{reverse("category-list")}?restaurant_id=1')
@@ -164,12 +217,12 @@ class CatalogueRoutesTests(APITestCase):
         )
 
         self.assertEqual(response_query.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response_query.data), 1)
-        self.assertEqual(response_query.data[0]["id"], self.category_r1.id)
+        self.assertEqual(len(response_query.data["results"]), 1)
+        self.assertEqual(response_query.data["results"][0]["id"], self.category_r1.id)
 
         self.assertEqual(response_nested.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response_nested.data), 1)
-        self.assertEqual(response_nested.data[0]["id"], self.category_r2.id)
+        self.assertEqual(len(response_nested.data["results"]), 1)
+        self.assertEqual(response_nested.data["results"][0]["id"], self.category_r2.id)
 
     def test_menus_routes_filter_by_restaurant(self):
         response_query = self.client.get(f'{reverse("menu-list")}?restaurant=1')
@@ -181,12 +234,12 @@ class CatalogueRoutesTests(APITestCase):
         )
 
         self.assertEqual(response_query.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response_query.data), 1)
-        self.assertEqual(response_query.data[0]["id"], self.menu_r1.id)
+        self.assertEqual(len(response_query.data["results"]), 1)
+        self.assertEqual(response_query.data["results"][0]["id"], self.menu_r1.id)
 
         self.assertEqual(response_nested.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response_nested.data), 1)
-        self.assertEqual(response_nested.data[0]["id"], self.menu_r2.id)
+        self.assertEqual(len(response_nested.data["results"]), 1)
+        self.assertEqual(response_nested.data["results"][0]["id"], self.menu_r2.id)
 
     def test_menu_categories_nested_route_filters_by_menu(self):
         response = self.client.get(
@@ -197,8 +250,8 @@ class CatalogueRoutesTests(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["id"], self.menu_category_r1.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["id"], self.menu_category_r1.id)
 
     def test_menu_products_nested_route_filters_by_menu(self):
         response = self.client.get(
@@ -209,23 +262,23 @@ class CatalogueRoutesTests(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["product"], self.product_r1.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["product"], self.product_r1.id)
 
     def test_products_categories_route_filters_by_restaurant_query(self):
         response = self.client.get(f'{reverse("productcategory-list")}?restaurant_id=1')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["product"], self.product_r1.id)
-        self.assertEqual(response.data[0]["category"], self.category_r1.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["product"], self.product_r1.id)
+        self.assertEqual(response.data["results"][0]["category"], self.category_r1.id)
 
     def test_categories_menu_route_filters_by_restaurant_query(self):
         response = self.client.get(f'{reverse("categorymenu-list")}?restaurant=2')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["id"], self.menu_category_r2.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["id"], self.menu_category_r2.id)
 
     def test_products_categories_menu_route_filters_by_restaurant_query(self):
         response = self.client.get(
@@ -233,9 +286,255 @@ class CatalogueRoutesTests(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["product"], self.product_r1.id)
-        self.assertEqual(response.data[0]["category"], self.menu_category_r1.id)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["product"], self.product_r1.id)
+        self.assertEqual(response.data["results"][0]["category"], self.menu_category_r1.id)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_restaurant_catalogue_route_returns_full_tree(self, mock_get):
+        mock_get.return_value = Mock(
+            status_code=200,
+            json=Mock(return_value={str(self.product_r1.id): True}),
+        )
+
+        response = self.client.get(
+            reverse("restaurant-catalogue", kwargs={"restaurant_id": 1})
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(mock_get.call_count, 1)
+        [menu] = response.data["menus"]
+        self.assertEqual(menu["id"], self.menu_r1.id)
+        [menu_category] = menu["categories"]
+        self.assertEqual(menu_category["id"], self.menu_category_r1.id)
+        self.assertEqual([p["id"] for p in menu_category["products"]], [self.product_r1.id])
+        self.assertTrue(menu_category["products"][0]["in_stock"])
+        [category] = response.data["categories"]
+        self.assertEqual(category["id"], self.category_r1.id)
+        self.assertEqual(category["products"][0]["categories"], [self.category_r1.id])
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_restaurant_catalogue_query_count_does_not_grow(self, mock_get):
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+        url = reverse("restaurant-catalogue", kwargs={"restaurant_id": 1})
+        with self.assertNumQueries(8):
+            self.client.get(url)
+
+        for i in range(5):
+            menu = Menu.objects.create(restaurant_id=1, name=f"Menu {i}", price="10.00")
+            category_menu = CategoryMenu.objects.create(menu=menu, name="Plats", quantity=1)
+            product = Product.objects.create(restaurant_id=1, name=f"Plat {i}", price="8.00")
+            ProductCategoryMenu.objects.create(category=category_menu, product=product)
+            ProductCategory.objects.create(category=self.category_r1, product=product)
+
+        with self.assertNumQueries(8):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["menus"]), 6)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_products_list_is_cursor_paginated_on_request(self, mock_get):
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+        extra = Product.objects.create(restaurant_id=1, name="Frites", price="3.00")
+        url = reverse("restaurant-products-list", kwargs={"restaurant_id": 1})
+
+        first = self.client.get(url, {"page_size": 1})
+        second = self.client.get(first.data["next"])
+
+        self.assertEqual([p["id"] for p in first.data["results"]], [self.product_r1.id])
+        self.assertEqual([p["id"] for p in second.data["results"]], [extra.id])
+        self.assertIn("in_stock", second.data["results"][0])
+        self.assertIsNone(second.data["next"])
+        self.assertIsNotNone(second.data["previous"])
+
+    def test_menu_products_nested_route_is_paginated_on_request(self):
+        response = self.client.get(
+            reverse("menu-products-list", kwargs={"menu_id": self.menu_r1.id}),
+            {"page_size": 10},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+    def test_search_falls_back_to_icontains_outside_postgres(self):
+        response = self.client.get(reverse("menu-list"), {"search": "mid"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m["id"] for m in response.data["results"]], [self.menu_r1.id])
+
+    def test_search_pages_keep_relevance_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, price in (("Frites", "6.00"), ("Salade", "8.00"), ("Soda", "6.00")):
+                Product.objects.create(restaurant_id=1, name=name, price=price, category=self.category_r1)
+
+        def ranked(filter_, request, queryset, view):
+            # stands in for the PostgreSQL rank, with ties
+            return queryset.annotate(search_rank=F("price")).order_by(*SEARCH_ORDERING)
+
+        expected = list(
+            Product.objects.order_by("-price", "id").values_list("id", flat=True)
+        )
+        seen = []
+        with patch.object(CatalogueSearchFilter, "filter_queryset", ranked):
+            url = f'{reverse("product-list")}?search=x&page_size=2&fields=id,name'
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                seen += [item["id"] for item in response.data["results"]]
+                url = response.data["next"]
+
+        self.assertEqual(seen, expected)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_soft_deleted_rows_are_hidden_from_reads(self, mock_get):
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+        Product.objects.filter(id=self.product_r1.id).update(deleted_at=timezone.now())
+
+        list_response = self.client.get(
+            reverse("restaurant-products-list", kwargs={"restaurant_id": 1})
+        )
+        detail_response = self.client.get(
+            reverse("product-detail", kwargs={"pk": self.product_r1.id})
+        )
+
+        self.assertEqual(list_response.data["results"], [])
+        self.assertEqual(detail_response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Product.all_objects.filter(id=self.product_r1.id).exists())
+
+    def test_restaurant_reads_answer_304_until_a_write(self):
+        url = reverse("restaurant-menus-list", kwargs={"restaurant_id": 1})
+        first = self.client.get(url)
+        etag = first["ETag"]
+        self.assertTrue(first.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Menu.objects.create(restaurant_id=1, name="Brunch", price="20.00")
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(len(changed.data["results"]), 2)
+
+    def test_menu_composition_write_changes_restaurant_etag(self):
+        url = reverse("restaurant-catalogue", kwargs={"restaurant_id": 1})
+        with patch(
+            "catalogue.stock_client.requests.Session.get",
+            return_value=Mock(status_code=200, json=Mock(return_value={})),
+        ):
+            etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductCategoryMenu.objects.filter(product=self.product_r1).delete()
+
+        self.assertNotEqual(RestaurantVersion.objects.current(1).etag, etag)
+
+    def test_bulk_create_products_writes_one_event_batch(self):
+        self.authenticate()
+        payload = [
+            {
+                "name": f"Wrap {i}",
+                "restaurant_id": "1",
+                "price": "7.50",
+                "category": self.category_r1.id,
+                "categories": [self.category_r1.id],
+            }
+            for i in range(20)
+        ]
+        self.publish_events.reset_mock()
+
+        with self.assertNumQueries(11):
+            response = self.client.post(reverse("product-bulk"), data=payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item["name"] for item in response.data], [f"Wrap {i}" for i in range(20)])
+        self.assertTrue(all(item["categories"] == [self.category_r1.id] for item in response.data))
+        self.assertEqual(ProductCategory.objects.filter(category=self.category_r1).count(), 21)
+        self.publish_events.assert_called_once()
+        events = [(resource, action) for resource, action, _, _ in self.publish_events.call_args.args[0]]
+        self.assertEqual(events.count(("product", "created")), 20)
+        self.assertEqual(events.count(("productcategory", "created")), 20)
+
+    def test_failed_write_request_keeps_etag_and_data(self):
+        self.authenticate()
+        version = RestaurantVersion.objects.current(1).version
+        self.publish_events.side_effect = IntegrityError
+        self.addCleanup(setattr, self.publish_events, "side_effect", None)
+
+        with self.assertRaises(IntegrityError):
+            self.client.patch(
+                reverse("product-detail", kwargs={"pk": self.product_r1.id}), data={"name": "Renamed"}, format="json"
+            )
+
+        self.product_r1.refresh_from_db()
+        self.assertEqual(self.product_r1.name, "Cheeseburger")
+        self.assertEqual(RestaurantVersion.objects.current(1).version, version)
+
+    def test_bulk_update_is_all_or_nothing(self):
+        self.authenticate()
+        response = self.client.patch(
+            reverse("product-bulk"),
+            data=[{"id": self.product_r1.id, "price": "11.00"}, {"id": 999999, "price": "1.00"}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product_r1.refresh_from_db()
+        self.assertEqual(self.product_r1.price, Decimal("10.00"))
+
+        response = self.client.patch(
+            reverse("product-bulk"),
+            data=[
+                {"id": self.product_r1.id, "price": "11.00", "categories": [self.category_r2.id]},
+                {"id": self.product_r2.id, "available": False},
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.product_r1.refresh_from_db()
+        self.assertEqual(self.product_r1.price, Decimal("11.00"))
+        self.assertEqual(list(self.product_r1.categories.values_list("id", flat=True)), [self.category_r2.id])
+        self.assertFalse(Product.objects.get(id=self.product_r2.id).available)
+
+    def test_bulk_menu_links_reject_duplicates_and_delete_by_ids(self):
+        self.authenticate()
+        url = reverse("productcategorymenu-bulk")
+        extra = Product.objects.create(restaurant_id=1, name="Fries", price="3.00")
+
+        duplicate = self.client.post(
+            url,
+            data=[{"category": self.menu_category_r1.id, "product": self.product_r1.id}],
+            format="json",
+        )
+        self.assertEqual(duplicate.status_code, status.HTTP_400_BAD_REQUEST)
+
+        created = self.client.post(
+            url,
+            data=[{"category": self.menu_category_r1.id, "product": extra.id}],
+            format="json",
+        )
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        etag = RestaurantVersion.objects.current(1).etag
+
+        deleted = self.client.delete(url, data={"ids": [created.data[0]["id"]]}, format="json")
+        self.assertEqual(deleted.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(ProductCategoryMenu.objects.filter(product=extra).exists())
+        self.assertNotEqual(RestaurantVersion.objects.current(1).etag, etag)
+
+    def test_reads_of_unknown_restaurants_write_nothing(self):
+        rows = RestaurantVersion.objects.count()
+
+        for rid in ("404", "x" * 80):
+            with self.subTest(restaurant_id=rid[:10]):
+                response = self.client.get(reverse("restaurant-categories-list", kwargs={"restaurant_id": rid}))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response["ETag"], f'W/"{rid}.0"')
+
+        self.assertEqual(RestaurantVersion.objects.count(), rows)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(restaurant_id="404", name="Nouveau")
+        self.assertEqual(RestaurantVersion.objects.current("404").version, 1)
 
     def test_anonymous_cannot_create_product(self):
         payload = {
@@ -385,12 +684,635 @@ class CatalogueRoutesTests(APITestCase):
         self.assertFalse(ProductCategory.objects.filter(id=link_id).exists())
 
 
+class FakeRedis:
+    """Just enough of the redis-py client for the catalogue caches."""
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def mget(self, keys):
+        return [self.store.get(k) for k in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def delete(self, *keys):
+        return sum(1 for k in keys if self.store.pop(k, None) is not None)
+
+    def incr(self, key):
+        value = int(self.store.get(key, b"0")) + 1
+        self.store[key] = str(value).encode()
+        return value
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+@override_settings(STOCK_API_BASE="http://stock.test/api", STOCK_AVAILABILITY_CACHE_TTL=30, CATALOGUE_RESPONSE_CACHE_TTL=0)
+class StockAvailabilityCacheTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.publish_event_patcher = patch("catalogue.signals.publish_catalogue_events")
+        cls.publish_events = cls.publish_event_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.publish_event_patcher.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        stock_client.breaker.reset()
+        self.redis = FakeRedis()
+        patcher = patch("catalogue.stock_cache.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.products = [
+            Product.objects.create(restaurant_id=1, name=f"P{i}", price="1.00") for i in range(3)
+        ]
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_list_fetches_only_uncached_ids(self, mock_get):
+        cached, *missing = self.products
+        self.redis.set(f"catalogue:stock:{cached.id}", b"0")
+        mock_get.return_value = Mock(
+            status_code=200,
+            json=Mock(return_value={str(p.id): True for p in missing}),
+        )
+
+        response = self.client.get(reverse("restaurant-products-list", kwargs={"restaurant_id": 1}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        requested = mock_get.call_args.kwargs["params"]["ids"].split(",")
+        self.assertEqual(sorted(requested), sorted(str(p.id) for p in missing))
+        payload = {item["id"]: item["in_stock"] for item in response.data["results"]}
+        self.assertFalse(payload[cached.id])
+        self.assertTrue(all(payload[p.id] for p in missing))
+        self.assertEqual(self.redis.get(f"catalogue:stock:{missing[0].id}"), b"1")
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_retrieve_is_served_from_cache(self, mock_get):
+        product = self.products[0]
+        self.redis.set(f"catalogue:stock:{product.id}", b"1")
+
+        response = self.client.get(reverse("product-detail", kwargs={"pk": product.id}))
+
+        self.assertTrue(response.data["in_stock"])
+        mock_get.assert_not_called()
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_redis_failure_falls_back_to_stock_api(self, mock_get):
+        broken = Mock()
+        broken.mget.side_effect = RedisConnectionError()
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={"available": True}))
+        product = self.products[0]
+
+        with patch("catalogue.stock_cache.get_redis", return_value=broken), \
+                patch("catalogue.stock_cache.mark_redis_down") as mark_down:
+            response = self.client.get(reverse("product-detail", kwargs={"pk": product.id}))
+
+        self.assertTrue(response.data["in_stock"])
+        mark_down.assert_called_once()
+
+
+@override_settings(CATALOGUE_RESPONSE_CACHE_TTL=60, STOCK_AVAILABILITY_CACHE_TTL=0)
+class ResponseCacheTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.publish_event_patcher = patch("catalogue.signals.publish_catalogue_events")
+        cls.publish_events = cls.publish_event_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.publish_event_patcher.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = patch("catalogue.response_cache.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.menu = Menu.objects.create(restaurant_id=1, name="Midi", price="12.50")
+        self.other_menu = Menu.objects.create(restaurant_id=2, name="Soir", price="15.00")
+        self.menu_category = CategoryMenu.objects.create(menu=self.menu, name="Plats", quantity=1)
+
+    def test_second_read_is_served_without_queries(self):
+        url = reverse("menu-categories-list", kwargs={"menu_id": self.menu.id})
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json(), first.json())
+
+    def test_write_invalidates_only_its_scopes(self):
+        r1 = reverse("menu-list") + "?restaurant=1"
+        r2 = reverse("menu-list") + "?restaurant=2"
+        self.client.get(r1)
+        self.client.get(r2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Menu.objects.create(restaurant_id=1, name="Brunch", price="20.00")
+
+        with self.assertNumQueries(1):
+            refreshed = self.client.get(r1)
+        with self.assertNumQueries(0):
+            self.client.get(r2)
+        self.assertEqual(len(refreshed.json()["results"]), 2)
+
+    def test_concurrent_miss_waits_for_the_rebuild(self):
+        url = reverse("menu-categories-list", kwargs={"menu_id": self.menu.id})
+        original_get = self.redis.get
+        seen = set()
+
+        def get(key):
+            # another worker holds the rebuild lock and fills the entry meanwhile
+            if key.startswith("catalogue:resp:") and key not in seen:
+                seen.add(key)
+                self.redis.store["catalogue:lock:" + key] = b"1"
+                return None
+            if key.startswith("catalogue:resp:"):
+                return b'[{"id": 99}]'
+            return original_get(key)
+
+        with patch.object(self.redis, "get", side_effect=get), self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.json(), [{"id": 99}])
+        self.assertGreaterEqual(response_cache.stats()["waits"], 1)
+
+
+@override_settings(
+    STOCK_API_BASE="http://stock.test/api",
+    STOCK_AVAILABILITY_CACHE_TTL=0,
+    CATALOGUE_RESPONSE_CACHE_TTL=0,
+    SERVER_TIMING_SAMPLE_RATE=1,
+)
+class ServerTimingTests(APITestCase):
+    def setUp(self):
+        stock_client.breaker.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(restaurant_id="1", name="Plats")
+            for name in ("Soupe", "Salade"):
+                product = Product.objects.create(restaurant_id="1", name=name, price=Decimal("4.00"), category=category)
+                product.categories.add(category)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_sampled_request_reports_where_its_time_went(self, mock_get):
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+
+        with self.assertLogs("core.timing", level="INFO") as logs:
+            response = self.client.get(reverse("restaurant-products-list", kwargs={"restaurant_id": 1}))
+
+        entries = {entry.split(";")[0]: entry for entry in response["Server-Timing"].split(", ")}
+        self.assertEqual(set(entries), {"db", "serialize", "stock", "render", "total"})
+        self.assertIn('desc="calls=1 ok=1"', entries["stock"])
+        self.assertIn('desc="calls=2"', entries["serialize"])
+        logged = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logged["path"], "/catalogue/restaurants/1/products/")
+        # restaurant version, products, prefetched categories
+        self.assertEqual(logged["timings"]["db"]["count"], 3)
+        self.assertEqual(logged["timings"]["stock"]["ok"], 1)
+
+    async def test_queries_are_timed_under_asgi(self):
+        response = await self.async_client.get(reverse("category-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        entries = {entry.split(";")[0]: entry for entry in response["Server-Timing"].split(", ")}
+        self.assertIn('desc="calls=1"', entries["db"])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_unsampled_request_is_not_measured(self, mock_get):
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+
+        response = self.client.get(reverse("restaurant-products-list", kwargs={"restaurant_id": 1}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header("Server-Timing"))
+
+
+@override_settings(STOCK_API_BASE="http://stock.test/api", STOCK_AVAILABILITY_CACHE_TTL=0, CATALOGUE_RESPONSE_CACHE_TTL=0)
+class MetricsTests(APITestCase):
+    def setUp(self):
+        stock_client.breaker.reset()
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_routes_and_stock_calls_are_exported(self, mock_get):
+        mock_get.side_effect = [Mock(status_code=503), requests.ConnectionError()]
+        labels = {"route": "restaurant-products-list", "method": "GET"}
+        before = REGISTRY.get_sample_value("catalogue_http_request_duration_seconds_count", labels) or 0
+        Product.objects.create(restaurant_id="1", name="Soupe", price=Decimal("4.00"))
+
+        self.client.get(reverse("restaurant-products-list", kwargs={"restaurant_id": 1}))
+        stock_client.availability(1)
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(REGISTRY.get_sample_value("catalogue_http_request_duration_seconds_count", labels), before + 1)
+        body = response.content.decode()
+        self.assertIn('catalogue_http_responses_total{method="GET",route="restaurant-products-list",status="200"}', body)
+        self.assertIn('catalogue_stock_api_errors_total{reason="server_error"}', body)
+        self.assertIn('catalogue_stock_api_errors_total{reason="connection"}', body)
+        self.assertNotIn('route="metrics"', body)
+
+
+@override_settings(STOCK_AVAILABILITY_CACHE_TTL=0, CATALOGUE_RESPONSE_CACHE_TTL=0, STOCK_API_CHUNK_SIZE=2)
+class AsyncProductReadsTests(APITestCase):
+    def setUp(self):
+        stock_client.breaker.reset()
+        self.stub = StockStub(unavailable_ratio=0.5, seed=3).start()
+        self.addCleanup(self.stub.stop)
+        self.enterContext(override_settings(STOCK_API_BASE=self.stub.base_url))
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(restaurant_id="1", name="Plats")
+            self.products = []
+            for n in range(5):
+                product = Product.objects.create(
+                    restaurant_id="1", name=f"Plat {n}", price=Decimal("4.00"), category=category,
+                )
+                product.categories.add(category)
+                self.products.append(product)
+
+    async def read(self, actions, path, **kwargs):
+        response = await product_view(actions)(AsyncRequestFactory().get(path), restaurant_id="1", **kwargs)
+        response.render()
+        return response
+
+    async def test_reads_match_the_sync_views(self):
+        list_path = reverse("restaurant-products-list", kwargs={"restaurant_id": 1})
+        detail_path = reverse("restaurant-products-detail", kwargs={"restaurant_id": 1, "pk": self.products[0].pk})
+        for actions, path, kwargs in (
+            ({"get": "list"}, list_path, {}),
+            ({"get": "list"}, list_path + "?page_size=2", {}),
+            ({"get": "retrieve"}, detail_path, {"pk": self.products[0].pk}),
+        ):
+            with self.subTest(path=path):
+                expected = await sync_to_async(self.client.get)(path)
+                response = await self.read(actions, path, **kwargs)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(json.loads(response.content), expected.json())
+                self.assertEqual(response["ETag"], expected["ETag"])
+        flags = {item["in_stock"] for item in json.loads((await self.read({"get": "list"}, list_path)).content)["results"]}
+        self.assertEqual(flags, {True, False})
+
+        missing = await self.read({"get": "retrieve"}, detail_path, pk=0)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_stock_lookup_overlaps_serialization(self):
+        started = threading.Event()
+        overlapped = []
+
+        async def availability_many(ids):
+            started.set()
+            return {i: True for i in ids}
+
+        represent = AsyncProductReads.represent
+
+        def represent_after_lookup(view, *args, **kwargs):
+            # the rows are serialized on the request's thread while the lookup runs on the loop
+            overlapped.append(started.wait(5))
+            return represent(view, *args, **kwargs)
+
+        with patch.object(async_stock_client, "availability_many", availability_many), \
+                patch.object(AsyncProductReads, "represent", represent_after_lookup):
+            response = await self.read({"get": "list"}, reverse("restaurant-products-list", kwargs={"restaurant_id": 1}))
+
+        self.assertEqual(overlapped, [True])
+        self.assertTrue(all(item["in_stock"] for item in json.loads(response.content)["results"]))
+
+    async def test_unreachable_stock_api_leaves_flags_unknown(self):
+        self.stub.failure_rate = 1.0
+        response = await self.read({"get": "list"}, reverse("restaurant-products-list", kwargs={"restaurant_id": 1}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({item["in_stock"] for item in json.loads(response.content)["results"]}, {None})
+        self.assertEqual(self.stub.stats()["requests"], 3)
+
+    async def test_sparse_read_skips_the_stock_lookup(self):
+        path = reverse("restaurant-products-list", kwargs={"restaurant_id": 1}) + "?fields=id,name"
+        response = await self.read({"get": "list"}, path)
+
+        self.assertEqual(json.loads(response.content)["results"][0], {"id": self.products[0].pk, "name": "Plat 0"})
+        self.assertEqual(self.stub.stats()["requests"], 0)
+
+
+@override_settings(STOCK_API_BASE="http://stock.test/api", STOCK_AVAILABILITY_CACHE_TTL=0, CATALOGUE_RESPONSE_CACHE_TTL=0)
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        stock_client.breaker.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(restaurant_id="1", name="Plats")
+            self.product = Product.objects.create(
+                restaurant_id="1", name="Soupe", description="Du jour", price=Decimal("4.00"),
+                image_url="https://img.test/soupe.png", category=category,
+            )
+            self.product.categories.add(category)
+            menu = Menu.objects.create(restaurant_id="1", name="Midi")
+            self.menu_category = CategoryMenu.objects.create(menu=menu, name="Plats", quantity=1)
+            ProductCategoryMenu.objects.create(category=self.menu_category, product=self.product)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_fields_narrow_the_columns_and_skip_prefetch_and_stock(self, mock_get):
+        path = reverse("restaurant-products-list", kwargs={"restaurant_id": 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, {"fields": "id,name,price,image_url"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.json()["results"][0]), ["id", "name", "image_url", "price"])
+        mock_get.assert_not_called()
+        # restaurant version and products: no categories prefetch
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"description"', queries[1]["sql"])
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_omit_keeps_the_stock_flag_when_not_omitted(self, mock_get):
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={"available": False}))
+        path = reverse("restaurant-products-detail", kwargs={"restaurant_id": 1, "pk": self.product.pk})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(path, {"omit": "categories,description,created_at,updated_at,deleted_at"})
+
+        self.assertEqual(
+            list(response.json()), ["id", "name", "restaurant_id", "image_url", "price", "category", "available", "in_stock"],
+        )
+        self.assertIs(response.json()["in_stock"], False)
+
+        # in_stock is computed from the id, which comes with it
+        flags = self.client.get(reverse("restaurant-products-list", kwargs={"restaurant_id": 1}), {"fields": "in_stock"})
+        self.assertEqual(flags.json()["results"], [{"id": self.product.pk, "in_stock": False}])
+
+    def test_serializer_viewsets_load_only_the_requested_columns(self):
+        path = reverse("menu-products-list", kwargs={"menu_id": self.menu_category.menu_id})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, {"fields": "product"})
+
+        self.assertEqual(response.json()["results"], [{"product": self.product.pk}])
+        self.assertNotIn('"categoryId"', queries[-1]["sql"].split(" FROM ")[0])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(
+            reverse("restaurant-categories-list", kwargs={"restaurant_id": 1}), {"fields": "name,secret", "omit": "nope"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"fields": ["Unknown field(s): secret."], "omit": ["Unknown field(s): nope."]})
+
+
+class FastReadPathTests(TestCase):
+    def setUp(self):
+        live = Category.objects.create(restaurant_id="1", name="Plats", description="Chauds")
+        gone = Category.objects.create(restaurant_id="1", name="Anciens", deleted_at=timezone.now())
+        Menu.objects.create(restaurant_id="1", name="Midi", price=Decimal("12.50"))
+        Menu.objects.create(restaurant_id="1", name="Soir \u2028 été", image_url="https://img.test/m.png")
+        first = Product.objects.create(restaurant_id="1", name="Crème brûlée", price=Decimal("6.5"), category=live)
+        first.categories.add(live, gone)
+        Product.objects.create(restaurant_id="1", name="Eau", price=Decimal("1.00"), available=False)
+
+    def test_values_rows_render_like_the_serializers(self):
+        for serializer_class in (ProductSerializer, MenuSerializer, CategorySerializer):
+            with self.subTest(serializer=serializer_class.__name__):
+                queryset = serializer_class.Meta.model.objects.prefetch_related(
+                    *(["categories"] if serializer_class is ProductSerializer else [])
+                ).order_by("id")
+                representation = ValuesRepresentation.of(serializer_class)
+                fast = representation.many(representation.rows(queryset))
+                expected = serializer_class(queryset, many=True).data
+
+                self.assertEqual(fast, expected)
+                self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(expected))
+                self.assertEqual(representation.one(representation.rows(queryset).first()), expected[0])
+
+    def test_renderer_matches_drf_for_other_payloads(self):
+        payload = {
+            "at": timezone.now(),
+            "price": Decimal("3.10"),
+            1: ["\u2029", None, True],
+            "detail": serializers.ErrorDetail("Not found.", code="not_found"),
+        }
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(
+            FastJSONRenderer().render(payload, "application/json; indent=2"),
+            JSONRenderer().render(payload, "application/json; indent=2"),
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_unsupported_serializers_fall_back(self):
+        class CustomSerializer(serializers.ModelSerializer):
+            label = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Category
+                fields = ("id", "label")
+
+        self.assertIsNone(ValuesRepresentation.of(CustomSerializer))
+        with override_settings(TIME_ZONE="Europe/Paris"):
+            self.assertIsNone(ValuesRepresentation.of(ProductSerializer))
+
+
+@override_settings(STOCK_API_BASE="http://stock.test/api", STOCK_API_CHUNK_SIZE=2)
+class StockClientTests(SimpleTestCase):
+    def setUp(self):
+        stock_client.breaker.reset()
+        self.addCleanup(stock_client.breaker.reset)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_availability_many_splits_ids_and_merges_partial_results(self, mock_get):
+        def answer(url, params=None, timeout=None):
+            ids = params["ids"].split(",")
+            if "5" in ids:
+                return Mock(status_code=503)
+            return Mock(status_code=200, json=Mock(return_value={i: True for i in ids}))
+        mock_get.side_effect = answer
+
+        result = stock_client.availability_many([1, 2, 3, 4, 5])
+
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(result, {"1": True, "2": True, "3": True, "4": True})
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_answered_chunk_reports_unlisted_ids_as_out_of_stock(self, mock_get):
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={"1": True}))
+
+        self.assertEqual(stock_client.availability_many([1, 2]), {"1": True, "2": False})
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_circuit_opens_and_fails_fast(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError()
+        for _ in range(stock_client.breaker.failure_threshold):
+            self.assertIsNone(stock_client.availability(1))
+
+        with self.assertRaises(StockUnavailable):
+            stock_client.get("products/1/availability/")
+        self.assertEqual(mock_get.call_count, stock_client.breaker.failure_threshold)
+
+    def test_half_open_breaker_allows_one_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+    async def test_cancelled_half_open_probe_releases_the_circuit(self):
+        client = AsyncStockClient(CircuitBreaker(failure_threshold=1, reset_timeout=0))
+        client.breaker.record_failure()
+        started = asyncio.Event()
+
+        async def hang(*args, **kwargs):
+            started.set()
+            await asyncio.sleep(60)
+
+        with patch("httpx.AsyncClient.get", hang):
+            probe = asyncio.create_task(client.get("products/availability/"))
+            await started.wait()
+            probe.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(client.breaker.allow())
+
+
+@override_settings(STOCK_API_BASE="http://stock.test/api", STOCK_AVAILABILITY_CACHE_TTL=0, CATALOGUE_RESPONSE_CACHE_TTL=0)
+class QueryBudgetTests(APITestCase):
+    """Every /catalogue/ read must run a fixed number of queries, whatever the data size.
+
+    Restaurant-scoped routes include one lookup of the restaurant's version for ETags.
+    """
+
+    RESTAURANTS = 3
+    PRODUCTS_PER_RESTAURANT = 40
+    MENUS_PER_RESTAURANT = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.publish_event_patcher = patch("catalogue.signals.publish_catalogue_events")
+        cls.publish_events = cls.publish_event_patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.publish_event_patcher.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        for rid in range(1, cls.RESTAURANTS + 1):
+            categories = Category.objects.bulk_create(
+                Category(restaurant_id=rid, name=f"Cat {rid}-{i}") for i in range(4)
+            )
+            products = Product.objects.bulk_create(
+                Product(restaurant_id=rid, name=f"Prod {rid}-{i}", price="5.00", category=categories[i % 4])
+                for i in range(cls.PRODUCTS_PER_RESTAURANT)
+            )
+            ProductCategory.objects.bulk_create(
+                ProductCategory(category=categories[(i + k) % 4], product=product)
+                for i, product in enumerate(products) for k in range(2)
+            )
+            menus = Menu.objects.bulk_create(
+                Menu(restaurant_id=rid, name=f"Menu {rid}-{i}", price="15.00")
+                for i in range(cls.MENUS_PER_RESTAURANT)
+            )
+            menu_categories = CategoryMenu.objects.bulk_create(
+                CategoryMenu(menu=menu, name=f"Step {k}", quantity=1) for menu in menus for k in range(3)
+            )
+            ProductCategoryMenu.objects.bulk_create(
+                ProductCategoryMenu(category=cm, product=products[(i * 7 + k) % len(products)])
+                for i, cm in enumerate(menu_categories) for k in range(4)
+            )
+        cls.product = Product.objects.filter(restaurant_id=1).first()
+        cls.category = Category.objects.filter(restaurant_id=1).first()
+        cls.menu = Menu.objects.filter(restaurant_id=1).first()
+        cls.menu_category = CategoryMenu.objects.filter(menu=cls.menu).first()
+        cls.menu_link = ProductCategoryMenu.objects.filter(category=cls.menu_category).first()
+        cls.link = ProductCategory.objects.filter(product=cls.product).first()
+        RestaurantVersion.objects.bump(range(1, cls.RESTAURANTS + 1))
+
+    def setUp(self):
+        stock_client.breaker.reset()
+        patcher = patch(
+            "catalogue.stock_client.requests.Session.get",
+            return_value=Mock(status_code=200, json=Mock(return_value={})),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def routes(self):
+        rid = {"restaurant_id": 1}
+        mid = {"menu_id": self.menu.id}
+        return [
+            (reverse("product-list"), 2),
+            (reverse("product-detail", kwargs={"pk": self.product.id}), 2),
+            (reverse("restaurant-products-list", kwargs=rid), 3),
+            (reverse("restaurant-products-detail", kwargs={**rid, "pk": self.product.id}), 3),
+            (reverse("category-list"), 1),
+            (reverse("category-detail", kwargs={"pk": self.category.id}), 1),
+            (reverse("restaurant-categories-list", kwargs=rid), 2),
+            (reverse("restaurant-categories-detail", kwargs={**rid, "pk": self.category.id}), 2),
+            (reverse("menu-list"), 1),
+            (reverse("menu-detail", kwargs={"pk": self.menu.id}), 1),
+            (reverse("restaurant-menus-list", kwargs=rid), 2),
+            (reverse("restaurant-menus-detail", kwargs={**rid, "pk": self.menu.id}), 2),
+            (reverse("productcategory-list"), 1),
+            (reverse("productcategory-detail", kwargs={"pk": self.link.id}), 1),
+            (reverse("categorymenu-list"), 1),
+            (reverse("categorymenu-detail", kwargs={"pk": self.menu_category.id}), 1),
+            (reverse("productcategorymenu-list"), 1),
+            (reverse("productcategorymenu-detail", kwargs={"pk": self.menu_link.id}), 1),
+            (reverse("menu-categories-list", kwargs=mid), 1),
+            (reverse("menu-categories-detail", kwargs={**mid, "pk": self.menu_category.id}), 1),
+            (reverse("menu-products-list", kwargs=mid), 1),
+            (reverse("menu-products-detail", kwargs={**mid, "pk": self.menu_link.id}), 1),
+            (reverse("restaurant-catalogue", kwargs=rid), 8),
+        ]
+
+    def test_read_routes_stay_within_query_budget(self):
+        for url, budget in self.routes():
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_paginated_routes_stay_within_query_budget(self):
+        for url, budget in self.routes():
+            if url.rstrip("/").split("/")[-1].isdigit():
+                continue
+            with self.subTest(url=url):
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url, {"page_size": 10})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_lists_are_paginated_by_default(self):
+        response = self.client.get(reverse("product-list"))
+
+        page_size = CatalogueCursorPagination.page_size
+        self.assertEqual([item["id"] for item in response.data["results"]], sorted(
+            Product.objects.values_list("id", flat=True)
+        )[:page_size])
+        self.assertIsNotNone(response.data["next"])
+        self.assertIsNone(response.data["previous"])
+
+
 class CatalogueDatabaseIntegrationTests(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        cls.publish_event_patcher = patch("catalogue.signals.publish_catalogue_event")
-        cls.publish_event_patcher.start()
+        cls.publish_event_patcher = patch("catalogue.signals.publish_catalogue_events")
+        cls.publish_events = cls.publish_event_patcher.start()
 
     @classmethod
     def tearDownClass(cls):
@@ -439,3 +1361,484 @@ class CatalogueDatabaseIntegrationTests(TestCase):
 
         menu.delete()
         self.assertFalse(CategoryMenu.objects.filter(id=category_menu.id).exists())
+
+
+class EventPublisherTests(SimpleTestCase):
+    def setUp(self):
+        self.channel = Mock(is_open=True)
+        self.connection = Mock(is_open=True)
+        self.connection.channel.return_value = self.channel
+        patcher = patch("core.rabbitmq._connection", return_value=self.connection)
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.publisher = EventPublisher()
+        self.addCleanup(self.publisher.close)
+
+    def test_publish_many_reuses_one_transactional_channel(self):
+        for i in range(5):
+            self.publisher.publish_many([("catalogue.product.updated", {"id": i})])
+
+        self.assertEqual(self.connect.call_count, 1)
+        self.channel.exchange_declare.assert_called_once()
+        self.channel.tx_select.assert_called_once()
+        self.assertEqual(self.channel.basic_publish.call_count, 5)
+        self.assertEqual(self.channel.tx_commit.call_count, 5)
+        stats = self.publisher.stats()
+        self.assertEqual(stats["published"], 5)
+        self.assertEqual(stats["batches"], 5)
+
+    def test_messages_carry_the_content_type_of_their_encoding(self):
+        self.publisher.publish_many([("a", {"id": 1, "price": Decimal("2.50")})])
+
+        kwargs = self.channel.basic_publish.call_args.kwargs
+        self.assertEqual(kwargs["properties"].content_type, event_codec.JSON)
+        self.assertEqual(event_codec.decode(kwargs["body"], kwargs["properties"].content_type), {"id": 1, "price": "2.50"})
+        with patch.object(event_codec, "msgpack", None):
+            self.assertEqual(event_codec.content_type_for("msgpack"), event_codec.JSON)
+
+    def test_publish_many_reconnects_after_channel_failure(self):
+        self.channel.basic_publish.side_effect = [AMQPConnectionError(), None, None]
+
+        self.publisher.publish_many([("a", {"id": 1}), ("b", {"id": 2})])
+
+        self.assertEqual(self.connect.call_count, 2)
+        # the whole batch goes again on the new channel, committed once
+        self.assertEqual(self.channel.basic_publish.call_count, 3)
+        self.assertEqual(self.channel.tx_commit.call_count, 1)
+        self.assertEqual(self.publisher.stats()["reconnects"], 1)
+        self.assertEqual(self.publisher.stats()["published"], 2)
+
+    def test_state_is_rebuilt_in_forked_child(self):
+        self.publisher.publish_many([("a", {"id": 1})])
+        self.publisher._pid = -1
+
+        self.publisher.publish_many([("b", {"id": 2})])
+
+        self.assertEqual(self.connect.call_count, 2)
+        self.assertEqual(self.publisher.stats()["published"], 1)
+
+
+@override_settings(CATALOGUE_RESPONSE_CACHE_TTL=0)
+class OutboxRelayTests(TestCase):
+    def test_product_save_event_follows_schema_without_m2m_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(restaurant_id="1", name="Drinks")
+            product = Product.objects.create(restaurant_id="1", name="Cola", price=Decimal("2.00"), category=category)
+        OutboxEvent.objects.all().delete()
+
+        product.name = "Cola zero"
+        # the UPDATE, its outbox INSERT and the version bump, all in the caller's transaction
+        with self.assertNumQueries(3):
+            product.save()
+
+        event = OutboxEvent.objects.get(routing_key="catalogue.product.updated").payload
+        self.assertEqual(event["version"], 1)
+        self.assertEqual(event["payload"]["price"], "2.00")
+        self.assertEqual(event["payload"]["category"], category.id)
+        self.assertNotIn("categories", event["payload"])
+
+    def test_event_batch_collapses_to_final_state(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(restaurant_id="1", name="Drinks")
+        OutboxEvent.objects.all().delete()
+
+        with transaction.atomic(), event_batch():
+            product = Product.objects.create(restaurant_id="1", name="Cola", price=Decimal("2.00"))
+            product.name = "Cola zero"
+            product.save()
+            product.categories.set([category])
+            scratch = Menu.objects.create(restaurant_id="1", name="Scratch", price=Decimal("1.00"))
+            scratch.delete()
+            self.assertFalse(OutboxEvent.objects.exists())
+
+        events = list(OutboxEvent.objects.values_list("routing_key", "payload"))
+        self.assertEqual([key for key, _ in events], ["catalogue.product.created"])
+        product_event = events[0][1]
+        self.assertEqual(product_event["payload"]["name"], "Cola zero")
+        self.assertEqual(product_event["payload"]["categories"], [category.id])
+
+    def test_category_clear_reports_only_its_own_products(self):
+        category = Category.objects.create(restaurant_id="1", name="Drinks")
+        cola = Product.objects.create(restaurant_id="1", name="Cola", price=Decimal("2.00"))
+        tea = Product.objects.create(restaurant_id="1", name="Tea", price=Decimal("2.00"))
+        category.products.add(cola)
+        category.products.clear()
+        OutboxEvent.objects.all().delete()
+
+        category.products.add(tea)
+
+        updated = [payload["id"] for payload in OutboxEvent.objects.values_list("payload", flat=True)]
+        self.assertEqual(updated, [tea.id])
+
+    def test_events_and_version_bump_roll_back_with_the_write(self):
+        product = Product.objects.create(restaurant_id="1", name="Cola", price=Decimal("2.00"))
+        OutboxEvent.objects.all().delete()
+        version = RestaurantVersion.objects.current("1").version
+
+        # a failure after the write, before the commit
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic(), event_batch():
+                Product.objects.filter(id=product.id).update(name="Cola zero")
+                record(product, "updated")
+                raise IntegrityError
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(RestaurantVersion.objects.current("1").version, version)
+
+        # a failure while the events are written
+        product.name = "Cola zero"
+        with patch.object(RestaurantVersion.objects, "bump", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    product.save()
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(Product.objects.get(id=product.id).name, "Cola")
+
+        with transaction.atomic():
+            product.save()
+        self.assertEqual(OutboxEvent.objects.filter(routing_key="catalogue.product.updated").count(), 1)
+        self.assertEqual(RestaurantVersion.objects.current("1").version, version + 1)
+
+    def test_catalogue_event_is_written_to_outbox(self):
+        publish_catalogue_events([("product", "updated", 7, {"id": 7, "price": Decimal("3.50")})])
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.routing_key, "catalogue.product.updated")
+        self.assertEqual(event.payload["id"], 7)
+        self.assertEqual(event.payload["payload"]["price"], "3.50")
+
+    @patch("catalogue.management.commands.relay_outbox_events.publisher.publish_many")
+    def test_relay_publishes_in_order_and_drains_outbox(self, mock_publish):
+        publish_catalogue_events([("menu", "created", i, {"id": i}) for i in range(3)])
+        out = StringIO()
+
+        call_command("relay_outbox_events", "--once", "--batch-size", "2", stdout=out)
+
+        sent = [payload["id"] for call in mock_publish.call_args_list for _, payload in call.args[0]]
+        self.assertEqual(sent, [0, 1, 2])
+        self.assertEqual(mock_publish.call_count, 2)
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertIn("Relayed 3 events", out.getvalue())
+        self.assertIn("0 waiting", out.getvalue())
+
+    @patch("catalogue.management.commands.relay_outbox_events.publisher.publish_many")
+    def test_relay_keeps_events_when_publish_fails(self, mock_publish):
+        publish_catalogue_events([("menu", "created", 1, {"id": 1})])
+
+        for error in (AMQPConnectionError(), ConnectionResetError()):
+            with self.subTest(error=type(error).__name__):
+                mock_publish.side_effect = error
+                with self.assertRaises(CommandError):
+                    call_command("relay_outbox_events", "--once", stdout=StringIO(), stderr=StringIO())
+                self.assertEqual(OutboxEvent.objects.count(), 1)
+
+
+@override_settings(STOCK_API_BASE="http://stock.test/api", CATALOGUE_RESPONSE_CACHE_TTL=0)
+class StockProductSyncTests(TestCase):
+    def setUp(self):
+        stock_client.breaker.reset()
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_sync_pages_and_keeps_catalogue_owned_fields(self, mock_get):
+        existing = Product.objects.create(
+            restaurant_id="1", name="Old name", description="Kept", price="9.00"
+        )
+        OutboxEvent.objects.all().delete()
+        mock_get.side_effect = [
+            Mock(status_code=200, json=Mock(return_value={
+                "next": "http://stock.test/api/products/?page=2",
+                "results": [{"id": existing.id, "name": "New name", "restaurantId": 1}],
+            })),
+            Mock(status_code=200, json=Mock(return_value={
+                "next": None,
+                "results": [{"id": existing.id + 1, "name": "Salad", "restaurantId": 1}, {"id": None}],
+            })),
+        ]
+        out = StringIO()
+
+        call_command("sync_stock_products", "--restaurant-id", "1", "--page-size", "1", stdout=out)
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args.args[0], "http://stock.test/api/products/?page=2")
+        self.assertIsNone(mock_get.call_args.kwargs["params"])
+        existing.refresh_from_db()
+        self.assertEqual(existing.name, "New name")
+        self.assertEqual(existing.price, Decimal("9.00"))
+        self.assertEqual(existing.description, "Kept")
+        self.assertTrue(Product.objects.filter(id=existing.id + 1, name="Salad").exists())
+        self.assertIn("Created: 1, Updated: 1", out.getvalue())
+        self.assertEqual(
+            OutboxEvent.objects.filter(routing_key__in=["catalogue.product.created", "catalogue.product.updated"]).count(),
+            2,
+        )
+
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_sync_follows_cursor_links_as_given(self, mock_get):
+        mock_get.side_effect = [
+            Mock(status_code=200, json=Mock(return_value={
+                "next": "http://stock.test/api/products/?cursor=cD0x",
+                "results": [{"id": 700, "name": "Tea", "restaurantId": 1}],
+            })),
+            Mock(status_code=200, json=Mock(return_value={
+                "next": "http://elsewhere.test/products/?cursor=cD0y",
+                "results": [{"id": 701, "name": "Coffee", "restaurantId": 1}],
+            })),
+        ]
+        err = StringIO()
+
+        call_command("sync_stock_products", "--restaurant-id", "1", stdout=StringIO(), stderr=err)
+
+        self.assertEqual(mock_get.call_args.args[0], "http://stock.test/api/products/?cursor=cD0x")
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(Product.objects.filter(id__in=[700, 701]).count(), 2)
+        self.assertIn("outside STOCK_API_BASE", err.getvalue())
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_sync_keeps_deletions_and_newer_stock_events(self, mock_get):
+        deleted = Product.objects.create(restaurant_id="1", name="Pie", price="5.00")
+        Product.objects.filter(id=deleted.id).update(deleted_at=timezone.now())
+        newer = Product.objects.create(
+            restaurant_id="1", name="Soup v2", price="4.00",
+            stock_event_at=timezone.now() + timedelta(minutes=5),
+        )
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value=[
+            {"id": deleted.id, "name": "Pie", "restaurantId": 1},
+            {"id": newer.id, "name": "Soup v1", "restaurantId": 1},
+        ]))
+        out = StringIO()
+
+        call_command("sync_stock_products", "--restaurant-id", "1", stdout=out)
+
+        self.assertIsNotNone(Product.all_objects.get(id=deleted.id).deleted_at)
+        self.assertEqual(Product.objects.get(id=newer.id).name, "Soup v2")
+        self.assertIn("Created: 0, Updated: 1", out.getvalue())
+
+
+@override_settings(CATALOGUE_RESPONSE_CACHE_TTL=0)
+class GenerateCatalogueTests(TestCase):
+    def generate(self, *args):
+        call_command(
+            "generate_catalogue", "--restaurants", "4", "--products", "30", "--chunk-size", "50", *args,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+        return {
+            "products": list(Product.all_objects.order_by("id").values_list("restaurant_id", "name", "price", "deleted_at")),
+            "categories": ProductCategory.objects.count(),
+            "menu_links": ProductCategoryMenu.objects.count(),
+        }
+
+    def test_same_seed_gives_the_same_catalogue_without_events(self):
+        first = self.generate("--seed", "7")
+        self.assertFalse(OutboxEvent.objects.exists())
+        for model in (ProductCategoryMenu, ProductCategory, CategoryMenu, Product, Category, Menu):
+            model._base_manager.all()._raw_delete("default")
+        second = self.generate("--seed", "7")
+
+        self.assertEqual(
+            [row[:3] for row in first["products"]], [row[:3] for row in second["products"]]
+        )
+        self.assertEqual(first["categories"], second["categories"])
+        self.assertEqual(first["menu_links"], second["menu_links"])
+        self.assertEqual({row[0] for row in first["products"]}, {"1000", "1001", "1002", "1003"})
+        self.assertGreaterEqual(first["categories"], len(first["products"]))
+
+    def test_refuses_restaurants_that_already_have_products(self):
+        Product.all_objects.create(restaurant_id="1000", name="Existing", price=Decimal("1.00"))
+        err = StringIO()
+
+        call_command("generate_catalogue", "--restaurants", "1", stdout=StringIO(), stderr=err)
+
+        self.assertIn("already have products", err.getvalue())
+        self.assertEqual(Product.all_objects.count(), 1)
+
+
+@override_settings(CATALOGUE_RESPONSE_CACHE_TTL=0, STOCK_AVAILABILITY_CACHE_TTL=0)
+class BenchmarkCatalogueTests(TransactionTestCase):
+    def test_stub_fails_the_configured_share_of_calls(self):
+        stub = StockStub(failure_rate=0.5, seed=3).start()
+        self.addCleanup(stub.stop)
+
+        statuses = [requests.get(f"{stub.base_url}/products/availability/", params={"ids": "1,2"}).status_code for _ in range(40)]
+
+        self.assertEqual(set(statuses), {200, 503})
+        self.assertEqual(stub.stats(), {"requests": 40, "failures": statuses.count(503)})
+
+    def test_stub_answers_the_availability_routes(self):
+        stub = StockStub(unavailable_ratio=0).start()
+        self.addCleanup(stub.stop)
+
+        many = requests.get(f"{stub.base_url}/products/availability/", params={"ids": "1,2"})
+        one = requests.get(f"{stub.base_url}/products/7/availability/")
+
+        self.assertEqual(many.json(), {"1": True, "2": True})
+        self.assertEqual(one.json(), {"id": "7", "available": True})
+
+    def test_benchmark_reports_latency_and_queries_per_route_on_both_stacks(self):
+        category = Category.objects.create(restaurant_id="1", name="Plats")
+        menu = Menu.objects.create(restaurant_id="1", name="Midi", price=Decimal("12.00"))
+        menu_category = CategoryMenu.objects.create(menu=menu, name="Plats", quantity=1)
+        for i in range(3):
+            product = Product.objects.create(restaurant_id="1", name=f"Soupe {i}", price=Decimal("4.00"), category=category)
+            ProductCategoryMenu.objects.create(category=menu_category, product=product)
+        for server in ("wsgi", "asgi"):
+            with self.subTest(server=server), tempfile.NamedTemporaryFile(suffix=".json") as output:
+                out, err = StringIO(), StringIO()
+                call_command(
+                    "benchmark_catalogue", "--requests", "20", "--warmup", "2", "--concurrency", "1",
+                    "--stock-latency-ms", "0", "--stock-jitter-ms", "0", "--server", server,
+                    "--output", output.name, stdout=out, stderr=err,
+                )
+                results = json.load(output)
+
+                self.assertEqual(results["config"]["server"], server)
+                self.assertEqual(results["overall"]["requests"], 20)
+                self.assertEqual(results["overall"]["errors"], 0)
+                self.assertEqual(set(results["routes"]), {"list", "retrieve", "menu", "search"})
+                for route in results["routes"].values():
+                    if route["requests"]:
+                        self.assertLessEqual(route["p50_ms"], route["p99_ms"])
+                        self.assertGreater(route["queries_per_request"], 0)
+                self.assertGreater(results["stock_stub"]["requests"], 0)
+                self.assertIn("overall", out.getvalue())
+                self.assertEqual(
+                    "CATALOGUE_ASYNC_READS is off" in err.getvalue(),
+                    server == "asgi" and not settings.CATALOGUE_ASYNC_READS,
+                )
+
+
+@override_settings(
+    STOCK_API_BASE="http://stock.test/api",
+    STOCK_AVAILABILITY_CACHE_TTL=0,
+    CATALOGUE_RESPONSE_CACHE_TTL=0,
+    STOCK_EVENT_DEDUP_TTL=0,
+)
+class StockEventBatchTests(TestCase):
+    def setUp(self):
+        stock_client.breaker.reset()
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_batch_uses_one_availability_call_and_last_event_wins(self, mock_get):
+        kept = Product.objects.create(restaurant_id="1", name="Soup", price="4.00")
+        gone = Product.objects.create(restaurant_id="1", name="Pie", price="5.00")
+        new_id = gone.id + 1
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={str(kept.id): False, str(new_id): True}))
+
+        def event(action, pid, name=None):
+            return {"resource": "products", "action": action, "id": pid, "payload": {"name": name, "restaurantId": 1}}
+
+        applied = apply_stock_events([
+            event("updated", kept.id, "Soup v1"),
+            event("updated", kept.id, "Soup v2"),
+            event("deleted", gone.id),
+            event("created", new_id, "Bread"),
+            {"resource": "orders", "action": "created", "id": 1},
+        ])
+
+        self.assertEqual(applied, 3)
+        self.assertEqual(mock_get.call_count, 1)
+        kept.refresh_from_db()
+        self.assertEqual((kept.name, kept.available, kept.price), ("Soup v2", False, Decimal("4.00")))
+        self.assertIsNotNone(Product.all_objects.get(id=gone.id).deleted_at)
+        self.assertTrue(Product.objects.get(id=new_id).available)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_stale_update_does_not_resurrect_deleted_product(self, mock_get):
+        product = Product.objects.create(restaurant_id="1", name="Soup", price="4.00")
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+
+        def event(action, timestamp):
+            return {
+                "resource": "products", "action": action, "id": product.id, "timestamp": timestamp,
+                "payload": {"name": "Soup", "restaurantId": 1},
+            }
+
+        self.assertEqual(apply_stock_events([event("deleted", "2026-01-01T10:00:00Z")]), 1)
+        self.assertEqual(apply_stock_events([event("updated", "2026-01-01T09:59:00Z")]), 0)
+
+        self.assertIsNotNone(Product.all_objects.get(id=product.id).deleted_at)
+        mock_get.assert_not_called()
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_redelivered_event_is_dropped_before_any_write(self, mock_get):
+        redis = FakeRedis()
+        patcher = patch("catalogue.stock_dedup.get_redis", return_value=redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+        body = b'{"resource": "products", "action": "created", "id": 500, "payload": {"name": "Tea", "restaurantId": 1}}'
+
+        with self.settings(STOCK_EVENT_DEDUP_TTL=60):
+            self.assertEqual(apply_stock_events([parse_stock_event(body, "msg-1")]), 1)
+            with self.assertNumQueries(0):
+                self.assertEqual(apply_stock_events([parse_stock_event(body, "msg-1")]), 0)
+            # without a producer id two identical bodies are two events
+            self.assertEqual(apply_stock_events([parse_stock_event(body)]), 1)
+
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("catalogue.stock_client.requests.Session.get")
+    def test_event_without_timestamp_keeps_the_watermark(self, mock_get):
+        product = Product.objects.create(restaurant_id="1", name="Soup", price="4.00")
+        mock_get.return_value = Mock(status_code=200, json=Mock(return_value={}))
+
+        def event(name, **extra):
+            return {"resource": "products", "action": "updated", "id": product.id,
+                    "payload": {"name": name, "restaurantId": 1}, **extra}
+
+        apply_stock_events([event("Soup v1", timestamp="2026-01-01T10:00:00Z")])
+        apply_stock_events([event("Soup v2")])
+
+        product.refresh_from_db()
+        self.assertEqual(product.name, "Soup v2")
+        self.assertEqual(product.stock_event_at.isoformat(), "2026-01-01T10:00:00+00:00")
+        self.assertEqual(apply_stock_events([event("Soup v0", timestamp="2026-01-01T09:00:00Z")]), 0)
+
+
+class StockEventDispatchTests(SimpleTestCase):
+    @patch("catalogue.stock_events.apply_stock_events")
+    def test_events_for_one_product_stay_in_order(self, mock_apply):
+        done = []
+        finished = threading.Event()
+
+        def on_done(tags, events, written):
+            done.extend(tags)
+            if len(done) == 40:
+                finished.set()
+
+        dispatcher = KeyedDispatcher(4, on_done, batch_size=3, batch_wait=0.01)
+        try:
+            for tag in range(40):
+                dispatcher.submit(tag % 5, tag, {"id": tag % 5, "seq": tag})
+            self.assertTrue(finished.wait(5))
+        finally:
+            dispatcher.close()
+
+        applied = [event for call in mock_apply.call_args_list for event in call.args[0]]
+        for key in range(5):
+            seqs = [event["seq"] for event in applied if event["id"] == key]
+            self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(sorted(done), list(range(40)))
+
+    def test_acks_only_advance_over_contiguous_deliveries(self):
+        channel = Mock()
+        tracker = AckTracker(channel)
+        for tag in (1, 2, 3):
+            tracker.delivered(tag)
+
+        tracker.completed([2])
+        channel.basic_ack.assert_not_called()
+        tracker.completed([1])
+        channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+        tracker.completed([3])
+        channel.basic_ack.assert_called_with(delivery_tag=3, multiple=True)
+
+    def test_acked_deliveries_are_counted(self):
+        before = REGISTRY.get_sample_value("catalogue_stock_events_acked_total") or 0
+        tracker = AckTracker(Mock())
+        for tag in (1, 2, 3):
+            tracker.delivered(tag)
+
+        tracker.completed([3, 1])
+        tracker.completed([2])
+
+        self.assertEqual(REGISTRY.get_sample_value("catalogue_stock_events_acked_total"), before + 3)
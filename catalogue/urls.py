@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
+from .async_views import product_view
 from .views import (
     ProductViewSet,
     CategoryViewSet,
@@ -7,8 +9,16 @@ from .views import (
     ProductCategoryViewSet,
     CategoryMenuViewSet,
     ProductCategoryMenuViewSet,
+    RestaurantCatalogueView,
 )
 
+if getattr(settings, 'CATALOGUE_ASYNC_READS', False):
+    product_list_view = product_view({'get': 'list', 'post': 'create'})
+    product_detail_view = product_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+else:
+    product_list_view = ProductViewSet.as_view({'get': 'list', 'post': 'create'})
+    product_detail_view = ProductViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'categories', CategoryViewSet, basename='category')
@@ -20,12 +30,13 @@ router.register(r'products-categories-menu', ProductCategoryMenuViewSet, basenam
 urlpatterns = [
     path('', include(router.urls)),
     # nested endpoints for restaurants
-    path('restaurants/<str:restaurant_id>/products/', ProductViewSet.as_view({'get': 'list', 'post': 'create'}), name='restaurant-products-list'),
-    path('restaurants/<str:restaurant_id>/products/<int:pk>/', ProductViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='restaurant-products-detail'),
+    path('restaurants/<str:restaurant_id>/products/', product_list_view, name='restaurant-products-list'),
+    path('restaurants/<str:restaurant_id>/products/<int:pk>/', product_detail_view, name='restaurant-products-detail'),
     path('restaurants/<str:restaurant_id>/categories/', CategoryViewSet.as_view({'get': 'list', 'post': 'create'}), name='restaurant-categories-list'),
     path('restaurants/<str:restaurant_id>/categories/<int:pk>/', CategoryViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='restaurant-categories-detail'),
     path('restaurants/<str:restaurant_id>/menus/', MenuViewSet.as_view({'get': 'list', 'post': 'create'}), name='restaurant-menus-list'),
     path('restaurants/<str:restaurant_id>/menus/<int:pk>/', MenuViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='restaurant-menus-detail'),
+    path('restaurants/<str:restaurant_id>/catalogue/', RestaurantCatalogueView.as_view(), name='restaurant-catalogue'),
 
     # nested endpoints for menus
     path('menus/<int:menu_id>/categories/', CategoryMenuViewSet.as_view({'get': 'list', 'post': 'create'}), name='menu-categories-list'),
@@ -1,7 +1,11 @@
-from rest_framework import viewsets, permissions, filters, status
+from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
-from django.conf import settings
-import requests
+from rest_framework.views import APIView
+from django.db.models import Q
+from .filters import CatalogueSearchFilter
+from .mixins import (
+    BulkWriteMixin, CachedResponseMixin, EventBatchWriteMixin, RestaurantConditionalMixin, SparseFieldsMixin, ValuesReadMixin,
+)
 from .models import Product, Category, Menu, ProductCategory, CategoryMenu, ProductCategoryMenu
 from .serializers import (
     ProductSerializer,
@@ -10,15 +14,43 @@ from .serializers import (
     ProductCategorySerializer,
     CategoryMenuSerializer,
     ProductCategoryMenuSerializer,
+    ProductBulkSerializer,
+    ProductCategoryBulkSerializer,
+    ProductCategoryMenuBulkSerializer,
+    represent_many,
 )
+from .stock_cache import availability_cache
+from .stock_client import stock_client
+
+
+def _fetch_one_availability(ids):
+    available = stock_client.availability(ids[0])
+    return {} if available is None else {ids[0]: available}
+
 
+def product_ids(data):
+    """The rows of a product list response and their ids, or ``(None, [])`` for any other payload."""
+    items = data.get('results') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None, []
+    return items, [item.get('id') for item in items if isinstance(item, dict) and item.get('id') is not None]
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+
+def set_stock_flags(items, in_stock_map):
+    """Set ``in_stock`` on each item; ids the lookup could not answer stay ``None``."""
+    for item in items:
+        pid = item.get('id')
+        item['in_stock'] = None if pid is None else in_stock_map.get(str(pid))
+
+
+class ProductViewSet(EventBatchWriteMixin, RestaurantConditionalMixin, SparseFieldsMixin, ValuesReadMixin, BulkWriteMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.prefetch_related('categories')
     serializer_class = ProductSerializer
+    bulk_serializer_class = ProductBulkSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [CatalogueSearchFilter]
     search_fields = ['name', 'description']
+    extra_fields = {'in_stock': 'id'}
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -29,59 +61,31 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         response = super().retrieve(request, *args, **kwargs)
-        if response.status_code != status.HTTP_200_OK:
+        if response.status_code != status.HTTP_200_OK or not self.wants('in_stock'):
             return response
         product_id = response.data.get('id')
         in_stock = None
-        base = getattr(settings, 'STOCK_API_BASE', '').rstrip('/')
-        if base and product_id is not None:
-            try:
-                url = f"{base}/products/{product_id}/availability/"
-                stock_resp = requests.get(url, timeout=2)
-                if stock_resp.status_code == 200:
-                    payload = stock_resp.json()
-                    in_stock = bool(payload.get('available'))
-            except Exception:
-                in_stock = None
+        if product_id is not None:
+            in_stock = availability_cache.lookup([product_id], _fetch_one_availability).get(str(product_id))
         response.data['in_stock'] = in_stock
         return response
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
-        if response.status_code != status.HTTP_200_OK:
+        if response.status_code != status.HTTP_200_OK or not self.wants('in_stock'):
             return response
-        data = response.data
-        items = data.get('results') if isinstance(data, dict) else data
-        if not isinstance(items, list):
+        items, ids = product_ids(response.data)
+        if items is None:
             return response
-        ids = [item.get('id') for item in items if isinstance(item, dict) and item.get('id') is not None]
-        in_stock_map = {}
-        base = getattr(settings, 'STOCK_API_BASE', '').rstrip('/')
-        if base and ids:
-            try:
-                url = f"{base}/products/availability/"
-                params = {'ids': ','.join(str(i) for i in ids)}
-                stock_resp = requests.get(url, params=params, timeout=2)
-                if stock_resp.status_code == 200:
-                    payload = stock_resp.json()
-                    if isinstance(payload, dict):
-                        in_stock_map = payload
-            except Exception:
-                in_stock_map = {}
-        for item in items:
-            pid = item.get('id')
-            if pid is None:
-                item['in_stock'] = None
-                continue
-            item['in_stock'] = bool(in_stock_map.get(str(pid))) if in_stock_map else None
+        set_stock_flags(items, availability_cache.lookup(ids, stock_client.availability_many) if ids else {})
         return response
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(EventBatchWriteMixin, RestaurantConditionalMixin, CachedResponseMixin, SparseFieldsMixin, ValuesReadMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [CatalogueSearchFilter]
     search_fields = ['name']
 
     def get_queryset(self):
@@ -92,11 +96,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return qs.filter(restaurant_id=rid)
 
 
-class MenuViewSet(viewsets.ModelViewSet):
+class MenuViewSet(EventBatchWriteMixin, RestaurantConditionalMixin, CachedResponseMixin, SparseFieldsMixin, ValuesReadMixin, viewsets.ModelViewSet):
     queryset = Menu.objects.all()
     serializer_class = MenuSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [CatalogueSearchFilter]
     search_fields = ['name']
 
     def get_queryset(self):
@@ -107,21 +111,22 @@ class MenuViewSet(viewsets.ModelViewSet):
             return qs
         return qs.filter(restaurant_id=rid)
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class ProductCategoryViewSet(EventBatchWriteMixin, SparseFieldsMixin, BulkWriteMixin, viewsets.ModelViewSet):
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
+    bulk_serializer_class = ProductCategoryBulkSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related('product')
+        qs = super().get_queryset()
         rid = self.kwargs.get('restaurant_id') or self.request.query_params.get('restaurant_id') or self.request.query_params.get('restaurant')
         if rid is None:
             return qs
         return qs.filter(product__restaurant_id=rid)
 
 
-class CategoryMenuViewSet(viewsets.ModelViewSet):
-    queryset = CategoryMenu.objects.select_related('menu').all()
+class CategoryMenuViewSet(EventBatchWriteMixin, CachedResponseMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    queryset = CategoryMenu.objects.all()
     serializer_class = CategoryMenuSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
@@ -141,13 +146,14 @@ class CategoryMenuViewSet(viewsets.ModelViewSet):
         return qs.filter(menu__restaurant_id=rid)
 
 
-class ProductCategoryMenuViewSet(viewsets.ModelViewSet):
+class ProductCategoryMenuViewSet(EventBatchWriteMixin, CachedResponseMixin, SparseFieldsMixin, BulkWriteMixin, viewsets.ModelViewSet):
     queryset = ProductCategoryMenu.objects.all()
     serializer_class = ProductCategoryMenuSerializer
+    bulk_serializer_class = ProductCategoryMenuBulkSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related('product')
+        qs = super().get_queryset()
         # support nested /menus/{menu_id}/products/ (filter by category__menu_id)
         menu_id = self.kwargs.get('menu_id')
         if menu_id is not None:
@@ -160,3 +166,71 @@ class ProductCategoryMenuViewSet(viewsets.ModelViewSet):
         if rid is None:
             return qs
         return qs.filter(product__restaurant_id=rid)
+
+
+class RestaurantCatalogueView(RestaurantConditionalMixin, APIView):
+    """Whole restaurant catalogue in one response, built with a fixed number of queries.
+
+    menus -> menu categories -> products, and categories -> products, with stock
+    availability merged from a single batched lookup.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, restaurant_id):
+        return self.conditional_response(request, self.build)
+
+    def build(self, request):
+        restaurant_id = self.kwargs['restaurant_id']
+        menus_data = represent_many(MenuSerializer, Menu.objects.filter(restaurant_id=restaurant_id).order_by('id'))
+        menu_categories_data = represent_many(
+            CategoryMenuSerializer, CategoryMenu.objects.filter(menu__restaurant_id=restaurant_id).order_by('id'),
+        )
+        menu_links = list(
+            ProductCategoryMenu.objects.filter(category__menu__restaurant_id=restaurant_id)
+            .order_by('id').values_list('category_id', 'product_id')
+        )
+        categories_data = represent_many(CategorySerializer, Category.objects.filter(restaurant_id=restaurant_id).order_by('id'))
+        category_links = list(
+            ProductCategory.objects.filter(category__restaurant_id=restaurant_id)
+            .order_by('id').values_list('category_id', 'product_id')
+        )
+        # linked products normally belong to the restaurant, but follow the links regardless
+        products = (
+            Product.objects.filter(
+                Q(restaurant_id=restaurant_id)
+                | Q(id__in=ProductCategoryMenu.objects.filter(category__menu__restaurant_id=restaurant_id).values('product_id'))
+                | Q(id__in=ProductCategory.objects.filter(category__restaurant_id=restaurant_id).values('product_id'))
+            )
+            .prefetch_related('categories')
+            .order_by('id')
+        )
+        product_data = {item['id']: item for item in represent_many(ProductSerializer, products)}
+
+        in_stock_map = availability_cache.lookup(list(product_data), stock_client.availability_many) if product_data else {}
+        for pid, item in product_data.items():
+            item['in_stock'] = in_stock_map.get(str(pid))
+
+        def linked(links):
+            grouped = {}
+            for parent_id, product_id in links:
+                if product_id in product_data:
+                    grouped.setdefault(parent_id, []).append(product_data[product_id])
+            return grouped
+
+        menu_products = linked(menu_links)
+        categories_by_menu = {}
+        for data in menu_categories_data:
+            categories_by_menu.setdefault(data['menu'], []).append(data)
+            data['products'] = menu_products.get(data['id'], [])
+        for data in menus_data:
+            data['categories'] = categories_by_menu.get(data['id'], [])
+
+        category_products = linked(category_links)
+        for data in categories_data:
+            data['products'] = category_products.get(data['id'], [])
+
+        return Response({
+            'restaurant_id': restaurant_id,
+            'menus': menus_data,
+            'categories': categories_data,
+        })
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# product reads overlap the Stock API call with serialization on the event loop
+os.environ.setdefault('CATALOGUE_ASYNC_READS', '1')
 
 application = get_asgi_application()
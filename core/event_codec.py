@@ -0,0 +1,58 @@
+"""Wire encodings for broker messages.
+
+JSON is the default and is read by every consumer. MessagePack is smaller
+and faster to decode; it is opt-in through ``RABBITMQ_EVENT_ENCODING`` and
+announced per message with the AMQP ``content_type``, so consumers pick the
+decoder from the message itself. Both codecs are optional dependencies with
+a stdlib fallback.
+"""
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional encoding
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+ENCODINGS = {"json": JSON, "msgpack": MSGPACK}
+
+
+def content_type_for(encoding: str) -> str:
+    """The content type to publish with for ``encoding``, falling back to JSON."""
+    content_type = ENCODINGS.get((encoding or "json").lower())
+    if content_type is None:
+        logger.warning("Unknown event encoding %r, publishing JSON", encoding)
+        return JSON
+    if content_type == MSGPACK and msgpack is None:
+        logger.warning("msgpack is not installed, publishing JSON")
+        return JSON
+    return content_type
+
+
+def encode(payload, content_type: str = JSON) -> bytes:
+    if content_type == MSGPACK:
+        return msgpack.packb(payload, default=str, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(payload, default=str)
+    return json.dumps(payload, default=str, separators=(",", ":")).encode()
+
+
+def decode(body, content_type: str = None):
+    """Decode ``body`` according to its ``content_type``; anything but MessagePack is JSON."""
+    if content_type == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
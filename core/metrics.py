@@ -0,0 +1,105 @@
+"""Prometheus metrics for the API, the Stock API client, the broker publisher and the stock consumer.
+
+Gunicorn workers are separate processes, so ``gunicorn.conf.py`` sets
+``PROMETHEUS_MULTIPROC_DIR``: every worker then writes its samples there and
+``/metrics`` merges them, whichever worker answers the scrape. Long-running
+management commands serve their own registry with ``--metrics-port``.
+"""
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'catalogue_http_request_duration_seconds', 'Latency of catalogue API requests', ['route', 'method'],
+)
+HTTP_RESPONSES = Counter(
+    'catalogue_http_responses', 'Catalogue API responses by status', ['route', 'method', 'status'],
+)
+STOCK_API_SECONDS = Histogram('catalogue_stock_api_request_duration_seconds', 'Latency of Stock API calls')
+STOCK_API_ERRORS = Counter(
+    'catalogue_stock_api_errors', 'Stock API calls that failed: connection, server_error or circuit_open', ['reason'],
+)
+PUBLISH_SECONDS = Histogram(
+    'catalogue_broker_publish_latency_seconds', 'Time from handing an event to the publisher to the commit of its batch',
+)
+OUTBOX_DEPTH = Gauge(
+    'catalogue_outbox_depth', 'Events waiting in the outbox, as last counted by a relay', multiprocess_mode='livemax',
+)
+PUBLISH_FAILURES = Counter('catalogue_broker_publish_failures', 'Events given up on after every reconnect attempt')
+STOCK_EVENTS_PROCESSED = Counter('catalogue_stock_events_processed', 'Stock events applied')
+STOCK_EVENTS_ACKED = Counter('catalogue_stock_events_acked', 'Stock event deliveries acked')
+STOCK_EVENTS_FAILED = Counter('catalogue_stock_events_failed', 'Stock events whose batch failed to apply')
+STOCK_EVENT_BATCH_SIZE = Histogram(
+    'catalogue_stock_event_batch_size', 'Stock events applied per batch',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+def registry():
+    """The registry to expose: merged across processes when ``PROMETHEUS_MULTIPROC_DIR`` is set."""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    merged = CollectorRegistry()
+    multiprocess.MultiProcessCollector(merged)
+    return merged
+
+
+def metrics_view(request):
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def serve(port):
+    """Expose ``/metrics`` of a management command on ``port`` (no-op when ``port`` is falsy)."""
+    if port:
+        start_http_server(port, registry=registry())
+
+
+class PrometheusMiddleware:
+    """Latency and status of every request routed to a ``catalogue`` view.
+
+    The route label is the URL name (``restaurant-products-list``), so ids in
+    the path never become labels; unresolved paths are not recorded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    def observe(self, request, response, started):
+        match = request.resolver_match
+        if match is not None and match.func.__module__.startswith('catalogue.'):
+            route = match.view_name
+            HTTP_REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - started)
+            HTTP_RESPONSES.labels(route, request.method, str(response.status_code)).inc()
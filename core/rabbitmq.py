@@ -1,24 +1,159 @@
-import json
+import atexit
+import logging
 import os
+import threading
+import time
+
 import pika
+from pika.exceptions import AMQPError
+
+from core import event_codec, metrics
+
+logger = logging.getLogger(__name__)
 
 RABBITMQ_HOST = os.environ.get("RABBITMQ_HOST", "rabbitmq")
 RABBITMQ_PORT = int(os.environ.get("RABBITMQ_PORT", 5672))
 RABBITMQ_USER = os.environ.get("RABBITMQ_USER", "guest")
 RABBITMQ_PASS = os.environ.get("RABBITMQ_PASS", "guest")
 RABBITMQ_EXCHANGE = os.environ.get("RABBITMQ_EXCHANGE", "goodfood.events")
+RABBITMQ_PUBLISH_RETRIES = int(os.environ.get("RABBITMQ_PUBLISH_RETRIES", 3))
+RABBITMQ_HEARTBEAT = int(os.environ.get("RABBITMQ_HEARTBEAT", 60))
+# "json" (default) or "msgpack"; consumers dispatch on the message content_type
+RABBITMQ_EVENT_ENCODING = os.environ.get("RABBITMQ_EVENT_ENCODING", "json")
 
 
 def _connection():
     creds = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-    params = pika.ConnectionParameters(host=RABBITMQ_HOST, port=RABBITMQ_PORT, credentials=creds)
+    params = pika.ConnectionParameters(
+        host=RABBITMQ_HOST,
+        port=RABBITMQ_PORT,
+        credentials=creds,
+        heartbeat=RABBITMQ_HEARTBEAT,
+    )
     return pika.BlockingConnection(params)
 
 
-def publish_event(routing_key: str, payload: dict):
-    body = json.dumps(payload, default=str)
-    conn = _connection()
-    ch = conn.channel()
-    ch.exchange_declare(exchange=RABBITMQ_EXCHANGE, exchange_type="topic", durable=True)
-    ch.basic_publish(exchange=RABBITMQ_EXCHANGE, routing_key=routing_key, body=body)
-    conn.close()
+class EventPublisher:
+    """Long-lived, per-process publisher for the outbox relay.
+
+    Batches go out synchronously over a single transactional channel, opened once
+    and reopened after failures, so the relay never pays the AMQP handshake per
+    batch. The state is rebuilt lazily after ``fork()`` so every process owns
+    its connection.
+    """
+
+    def __init__(self, retries=RABBITMQ_PUBLISH_RETRIES, encoding=RABBITMQ_EVENT_ENCODING):
+        self.content_type = event_codec.content_type_for(encoding)
+        self.retries = retries
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._channel = None
+        self._counters = {
+            "published": 0,
+            "batches": 0,
+            "reconnects": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+        }
+
+    # -- connection handling -------------------------------------------------
+
+    def _open_channel(self):
+        if self._channel is not None and self._channel.is_open:
+            return self._channel
+        self._close()
+        self._conn = _connection()
+        ch = self._conn.channel()
+        ch.exchange_declare(exchange=RABBITMQ_EXCHANGE, exchange_type="topic", durable=True)
+        # publishes are committed per batch; tx_commit is the batch's confirm
+        ch.tx_select()
+        self._channel = ch
+        return ch
+
+    def _close(self):
+        conn, self._conn, self._channel = self._conn, None, None
+        if conn is not None and conn.is_open:
+            try:
+                conn.close()
+            except AMQPError:
+                pass
+
+    def _send(self, messages):
+        """Publish ``messages`` in one AMQP transaction, reconnecting on failure.
+
+        Each entry is ``(routing_key, body, enqueued_at)``. The whole batch is
+        published and then committed, so it costs one round trip to the broker,
+        which answers the commit once every message is routed and persisted. A
+        failure before the commit-ok sends the batch again on a fresh channel.
+        Raises the last AMQP error once ``retries`` reconnect attempts have been
+        exhausted.
+        """
+        if not messages:
+            return
+        properties = pika.BasicProperties(content_type=self.content_type, delivery_mode=2)
+        attempt = 0
+        while True:
+            with self._lock:
+                try:
+                    ch = self._open_channel()
+                    for routing_key, body, _ in messages:
+                        ch.basic_publish(
+                            exchange=RABBITMQ_EXCHANGE, routing_key=routing_key, body=body, properties=properties,
+                        )
+                    ch.tx_commit()
+                    break
+                except AMQPError:
+                    self._close()
+                    attempt += 1
+                    if attempt > self.retries:
+                        metrics.PUBLISH_FAILURES.inc(len(messages))
+                        raise
+                    self._counters["reconnects"] += 1
+                    logger.warning("RabbitMQ publish failed, reconnecting (attempt %s)", attempt)
+            time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        committed = time.monotonic()
+        for _, _, enqueued_at in messages:
+            self._observe(committed - enqueued_at)
+        self._counters["batches"] += 1
+
+    def _observe(self, latency):
+        c = self._counters
+        c["published"] += 1
+        c["latency_total"] += latency
+        c["latency_max"] = max(c["latency_max"], latency)
+        metrics.PUBLISH_SECONDS.observe(latency)
+
+    # -- public API ----------------------------------------------------------
+
+    def publish_many(self, events):
+        """Publish ``(routing_key, payload)`` pairs and wait once for the broker to commit them.
+
+        Raises ``pika.exceptions.AMQPError`` if the batch could not be delivered.
+        """
+        if self._pid != os.getpid():
+            self._reset()
+        now = time.monotonic()
+        self._send([(rk, event_codec.encode(payload, self.content_type), now) for rk, payload in events])
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._close()
+
+    def stats(self) -> dict:
+        c = dict(self._counters)
+        total = c.pop("latency_total")
+        c["latency_avg"] = total / c["published"] if c["published"] else 0.0
+        return c
+
+
+publisher = EventPublisher()
+atexit.register(publisher.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=publisher._reset)
+
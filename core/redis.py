@@ -0,0 +1,35 @@
+import time
+
+import redis
+from django.conf import settings
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+_client = None
+_down_until = 0.0
+
+
+def get_redis():
+    """Shared client; redis-py's connection pool is thread- and fork-safe."""
+    global _client
+    if _client is None:
+        timeout = getattr(settings, 'REDIS_SOCKET_TIMEOUT', 0.1)
+        _client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            socket_connect_timeout=timeout,
+            socket_timeout=timeout,
+            retry=Retry(NoBackoff(), 1),
+            health_check_interval=30,
+        )
+    return _client
+
+
+def redis_available() -> bool:
+    """False while a recent failure is cooling down, so callers skip Redis instead of timing out."""
+    return time.monotonic() >= _down_until
+
+
+def mark_redis_down():
+    global _down_until
+    _down_until = time.monotonic() + getattr(settings, 'REDIS_RETRY_AFTER', 30)
@@ -39,12 +39,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders',
     'catalogue.apps.CatalogueConfig',
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.PrometheusMiddleware',
+    'core.timing.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -109,8 +112,21 @@ else:
 
 REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
 REDIS_PORT = int(os.environ.get('REDIS_PORT', 6380))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.1))
+REDIS_RETRY_AFTER = int(os.environ.get('REDIS_RETRY_AFTER', 30))
 
 STOCK_API_BASE = os.environ.get('STOCK_API_BASE', 'http://stock-api:8000/api')
+STOCK_API_TIMEOUT = float(os.environ.get('STOCK_API_TIMEOUT', 2))
+STOCK_API_POOL_SIZE = int(os.environ.get('STOCK_API_POOL_SIZE', 20))
+# ids per /products/availability/ request; bigger lists are split and fetched in parallel
+STOCK_API_CHUNK_SIZE = int(os.environ.get('STOCK_API_CHUNK_SIZE', 100))
+STOCK_API_MAX_WORKERS = int(os.environ.get('STOCK_API_MAX_WORKERS', 4))
+STOCK_API_BREAKER_THRESHOLD = int(os.environ.get('STOCK_API_BREAKER_THRESHOLD', 5))
+STOCK_API_BREAKER_RESET = float(os.environ.get('STOCK_API_BREAKER_RESET', 30))
+# Seconds a product's availability stays cached in Redis; 0 disables the cache.
+STOCK_AVAILABILITY_CACHE_TTL = int(os.environ.get('STOCK_AVAILABILITY_CACHE_TTL', 30))
+# Seconds applied stock event ids are remembered in Redis to drop redeliveries; 0 disables.
+STOCK_EVENT_DEDUP_TTL = int(os.environ.get('STOCK_EVENT_DEDUP_TTL', 3600))
 
 
 # Password validation
@@ -164,7 +180,28 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'core.auth.MicroserviceJWTAuthentication',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'catalogue.pagination.CatalogueCursorPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Share of requests (0..1) measured by core.timing: Server-Timing header plus one JSON log line each.
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', 0.01))
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', '1') == '1'
+
+# Seconds a cached catalogue GET response lives in Redis; 0 disables the response cache.
+CATALOGUE_RESPONSE_CACHE_TTL = int(os.environ.get('CATALOGUE_RESPONSE_CACHE_TTL', 300))
+# How long a cache rebuild holds its lock, and how long other requests wait for it.
+CATALOGUE_RESPONSE_CACHE_LOCK_MS = int(os.environ.get('CATALOGUE_RESPONSE_CACHE_LOCK_MS', 2000))
+
+# Serve the product list/retrieve routes with catalogue.async_views; on by default under core.asgi.
+CATALOGUE_ASYNC_READS = os.environ.get('CATALOGUE_ASYNC_READS', '0') == '1'
+
+CATALOGUE_PAGE_SIZE = int(os.environ.get('CATALOGUE_PAGE_SIZE', 50))
+CATALOGUE_MAX_PAGE_SIZE = int(os.environ.get('CATALOGUE_MAX_PAGE_SIZE', 500))
+CATALOGUE_BULK_MAX_ITEMS = int(os.environ.get('CATALOGUE_BULK_MAX_ITEMS', 1000))
+
 JWT_PUBLIC_KEY = os.environ.get('JWT_PUBLIC_KEY', '').replace('\\n', '\n')
 
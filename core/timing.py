@@ -0,0 +1,204 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_timings = ContextVar('request_timings', default=None)
+# seconds spent in the timed blocks directly nested in the innermost one
+_frame = ContextVar('request_timing_frame', default=None)
+
+
+class RequestTimings:
+    """Durations and outcomes collected while one sampled request runs.
+
+    ``add`` and ``count`` may be called from helper threads that run in a copy
+    of the request's context (see ``StockClient.availability_many``).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.metrics = {}
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, calls=1):
+        with self._lock:
+            metric = self.metrics.setdefault(name, [0, 0.0])
+            metric[0] += calls
+            metric[1] += seconds
+
+    def count(self, name, outcome):
+        with self._lock:
+            outcomes = self.outcomes.setdefault(name, {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def summary(self) -> dict:
+        """``{name: {'count', 'ms', outcome: n, ...}}`` plus ``total`` so far."""
+        with self._lock:
+            summary = {
+                name: {'count': n, 'ms': round(seconds * 1000, 3), **self.outcomes.get(name, {})}
+                for name, (n, seconds) in self.metrics.items()
+            }
+            for name, outcomes in self.outcomes.items():
+                summary.setdefault(name, {'count': 0, 'ms': 0.0, **outcomes})
+        summary['total'] = {'count': 1, 'ms': round((time.perf_counter() - self.started) * 1000, 3)}
+        return summary
+
+    @staticmethod
+    def header(summary) -> str:
+        """The ``Server-Timing`` value of a ``summary()``: ``db;dur=3.1;desc="calls=4"``, ..., ``total;dur=...``."""
+        entries = []
+        for name, metric in summary.items():
+            details = [f"calls={metric['count']}"] + [
+                f"{key}={value}" for key, value in metric.items() if key not in ('count', 'ms')
+            ]
+            desc = '' if name == 'total' else f';desc="{" ".join(details)}"'
+            entries.append(f"{name};dur={metric['ms']:.1f}{desc}")
+        return ', '.join(entries)
+
+
+@contextmanager
+def timed(name, exclusive=False, calls=1):
+    """Add the duration of the block to ``name`` on the current request, if sampled.
+
+    ``calls`` is how many operations the block stands for (rows serialized
+    in one go, for instance).
+
+    An ``exclusive`` block leaves out the time of the timed blocks and queries
+    nested in it: ``serialize`` then reports the serializer's own time even when
+    it triggers lazy queries, which land in ``db``. Other blocks overlap (the
+    outbox INSERT of ``publish`` is also in ``db``).
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    parent = _frame.get()
+    frame = [0.0]
+    token = _frame.set(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _frame.reset(token)
+        if parent is not None:
+            parent[0] += elapsed
+        timings.add(name, elapsed - frame[0] if exclusive else elapsed, calls)
+
+
+def count(name, outcome):
+    """Count an ``outcome`` (``ok``, ``error``, ...) of ``name`` on the current request, if sampled."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.count(name, outcome)
+
+
+def _timed_query(execute, sql, params, many, context):
+    if _timings.get() is None:
+        return execute(sql, params, many, context)
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+def _install_query_timer(connection, **kwargs):
+    """Time the queries of every connection, on any thread, as ``db``.
+
+    The wrapper goes first so ``execute_wrapper()`` blocks, which pop the last
+    wrapper on exit, leave it in place.
+    """
+    if _timed_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _timed_query)
+
+
+connection_created.connect(_install_query_timer)
+for _connection in connections.all(initialized_only=True):
+    _install_query_timer(_connection)
+
+
+class ServerTimingMiddleware:
+    """Measure a sample of requests and report where their time went.
+
+    ``SERVER_TIMING_SAMPLE_RATE`` (0..1) picks the requests; unsampled ones
+    only pay one ``random()`` call. Sampled requests get a ``Server-Timing``
+    header (unless ``SERVER_TIMING_HEADER`` is off) and one JSON log line on
+    ``core.timing`` with the query count and time, the Stock API time and
+    outcomes, the publish time and the serialization and rendering time.
+    Queries are timed on whichever thread runs them, which under ASGI is one
+    of ``sync_to_async``'s.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def sample(self):
+        """A fresh ``RequestTimings`` if this request is measured, else ``None``."""
+        rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 0.0)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return None
+        return RequestTimings()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = self.sample()
+        if timings is None:
+            return self.get_response(request)
+
+        token = _timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.report(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = self.sample()
+        if timings is None:
+            return await self.get_response(request)
+
+        token = _timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        summary = timings.summary()
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = RequestTimings.header(summary)
+        logger.info(json.dumps({
+            'event': 'request_timings',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'timings': summary,
+        }))
+        return response
+
+
+class TimedSerializerMixin:
+    """Time ``to_representation`` as ``serialize``, excluding the queries it triggers."""
+
+    def to_representation(self, instance):
+        # called once per row: skip building the context manager on unsampled requests
+        if _timings.get() is None:
+            return super().to_representation(instance)
+        with timed('serialize', exclusive=True):
+            return super().to_representation(instance)
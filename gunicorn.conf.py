@@ -0,0 +1,20 @@
+"""Gunicorn settings, read from the working directory by ``gunicorn core.asgi:application`` (or ``core.wsgi``)."""
+import os
+import shutil
+import tempfile
+
+# workers are separate processes: prometheus_client keeps per-process files here and /metrics merges them
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'catalogue-prometheus'))
+
+
+def on_starting(server):
+    # files of a previous master would be merged into the new totals
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)